@@ -1,135 +1,164 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-from datetime import datetime
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col
-
-
-st.set_page_config(
-    page_title="Appointment Dashboard",
-    initial_sidebar_state="collapsed",
-    layout="wide"
-)
-
-st.logo("https://i.ibb.co/bbH9pgH/Purelight-Logo.webp")
-
-hide_streamlit_style = """
-    <style>
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    .css-10trblm {padding-top: 0px; padding-bottom: 0px;}
-    .css-1d391kg {padding-top: 0px !important;}
-    </style>
+import connection
+import page_setup
+import os
+import uuid
+from snapshot_store import WarmStart
+from cache_backend import shared_backend
+from result_cache import shared_cache, versioned_result
+from query_governor import GovernedSession
+import target_import
+from save_queue import SaveQueue, flush_targets, flush_markets, format_version, SAVED, CONFLICT, FAILED, SUPERSEDED
+
+page_setup.require_entry_point()
+
+# Statements of this page, tagged with the manager
+session = GovernedSession(page_setup.snowflake_sessions(), 'targets', user=page_setup.current_user())
+
+users_query = """
+    SELECT DISTINCT FULL_NAME, SALESFORCE_ID
+    FROM operational.airtable.vw_users 
+    WHERE role_type IN ('Closer', 'Manager') AND term_date IS NULL
 """
-st.markdown(hide_streamlit_style, unsafe_allow_html=True)
-
-# Function to create a Snowflake session
-def create_snowflake_session():
-    connection_parameters = {
-        "account": st.secrets["snowflake"]["account"],
-        "user": st.secrets["snowflake"]["user"],
-        "password": st.secrets["snowflake"]["password"],
-        "role": st.secrets["snowflake"]["role"],
-        "warehouse": st.secrets["snowflake"]["warehouse"],
-        "database": st.secrets["snowflake"]["database"],
-        "schema": st.secrets["snowflake"]["schema"],
-    }
-    return Session.builder.configs(connection_parameters).create()
-
-# Initialize Snowpark session
-session = create_snowflake_session()
-
-# Cache functions to avoid redundant queries
-@st.cache_data(show_spinner=False, persist=True)
-def get_users(data_version):
-    users_query = """
-        SELECT DISTINCT FULL_NAME, SALESFORCE_ID
-        FROM operational.airtable.vw_users 
-        WHERE role_type IN ('Closer', 'Manager') AND term_date IS NULL
-    """
-    return session.sql(users_query).to_pandas()
-
-@st.cache_data(show_spinner=False, persist=True)
-def get_market(data_version):
-    users_query = """
-        SELECT MARKET, MARKET_GROUP, RANK, NOTES
-        FROM raw.snowflake.lm_markets 
-    """
-    return session.sql(users_query).to_pandas()
-
-@st.cache_data(show_spinner=False, persist=True)
-def get_profile_pictures(data_version):
-    profile_picture_query = """
-        SELECT FULL_NAME, PROFILE_PICTURE
-        FROM operational.airtable.vw_users
-    """
-    return session.sql(profile_picture_query).to_pandas()
-
-@st.cache_data(show_spinner=False, persist=True)
-def get_appointments(data_version):
-    appointments_query = """
-        SELECT * FROM raw.snowflake.lm_appointments
-    """
-    return session.sql(appointments_query).to_pandas()
+
+markets_query = """
+    SELECT MARKET, MARKET_GROUP, RANK, NOTES
+    FROM raw.snowflake.lm_markets 
+"""
+
+profile_picture_query = """
+    SELECT FULL_NAME, PROFILE_PICTURE
+    FROM operational.airtable.vw_users
+"""
+
+appointments_query = """
+    SELECT * FROM raw.snowflake.lm_appointments
+"""
+
+# Query results of this page, shared by every session; see versioned_result
+result_cache = shared_cache()
+
+def cached_query(name, query):
+    return versioned_result('targets', name, lambda: session.for_stage(name).sql(query).to_pandas())
+
+def get_users():
+    return cached_query('users', users_query)
+
+def get_market():
+    return cached_query('markets', markets_query)
+
+def get_profile_pictures():
+    return cached_query('profile_pictures', profile_picture_query)
+
+def get_appointments():
+    return cached_query('appointments', appointments_query)
+
+# Cached results that read targets or markets, dropped after every save
+SAVED_DATA_NAMESPACES = ('targets', 'web_appointments', 'fm_appointments')
+
+# Drop them here and bump their shared version, so every replica's result cache
+# and snapshots move on to the saved data
+def invalidate_saved_data():
+    result_cache.invalidate(*SAVED_DATA_NAMESPACES)
+    shared_backend().bump(*SAVED_DATA_NAMESPACES)
+
+# One write queue per server process, shared by every manager's session. It
+# invalidates the saved data itself once a batch lands, whether or not the
+# manager's page is still open to collect the result.
+@st.cache_resource
+def get_save_queue():
+    return SaveQueue(lambda: GovernedSession(connection.create_snowflake_session(st.secrets), 'targets', 'save', 'save-queue'),
+                     {'target': flush_targets, 'market': flush_markets},
+                     on_saved=lambda kind, entries: invalidate_saved_data())
+
+save_queue = get_save_queue()
+
+# Identify this browser session as the owner of the writes it queues
+if 'save_owner' not in st.session_state:
+    st.session_state['save_owner'] = uuid.uuid4().hex
+if 'save_conflicts' not in st.session_state:
+    st.session_state['save_conflicts'] = []
 
 # Check if data_version exists in session state
 if 'data_version' not in st.session_state:
     st.session_state['data_version'] = 0
 
-# Load data with caching and pass data_version as a dependency
-df_users = get_users(st.session_state['data_version'])
-df_markets = get_market(st.session_state['data_version'])
-profile_picture = get_profile_pictures(st.session_state['data_version'])
-appointments = get_appointments(st.session_state['data_version'])
-unique_markets_df = appointments[['MARKET']].drop_duplicates()
-
-
-# Merge the dataframes on the full name
-merged_df = df_users.merge(
-    appointments, left_on='FULL_NAME', right_on='NAME', how='left'
-).merge(
-    profile_picture, on='FULL_NAME', how='left'
-)
-
-# Rename and drop columns as needed
-merged_df = merged_df.rename(columns={
-    'FULL_NAME': 'FULL_NAME',
-    'PROFILE_PICTURE_y': 'PROFILE_PICTURE'
-})
-
-if 'CLOSER' in merged_df.columns:
-    merged_df = merged_df.drop(columns=['CLOSER'])
-
-# Fill NaN values and ensure correct data types
-merged_df['MARKET'] = merged_df['MARKET'].fillna('No Market').astype(str)
-merged_df['GOAL'] = merged_df['GOAL'].fillna(0).astype(int)
-merged_df['RANK'] = merged_df['RANK'].fillna(100).astype(int)
-merged_df['FM_GOAL'] = merged_df['FM_GOAL'].fillna(0).astype(int)
-merged_df['FM_RANK'] = merged_df['FM_RANK'].fillna(100).astype(int)
-merged_df['TYPE'] = merged_df['TYPE'].fillna('🏠🏃 Hybrid').astype(str)
-merged_df['PROFILE_PICTURE'] = merged_df['PROFILE_PICTURE'].fillna('https://i.ibb.co/ZNK5xmN/pdycc8-1-removebg-preview.png').astype(str)
-
-# Convert 'ACTIVE' column to boolean
-merged_df['ACTIVE'] = merged_df['ACTIVE'].fillna('No').astype(str)
-merged_df['ACTIVE'] = merged_df['ACTIVE'].str.strip().str.lower().map({'yes': True, 'no': False})
-merged_df['ACTIVE'] = merged_df['ACTIVE'].fillna(False)
-
-# Ensure 'TYPE' column has valid options
+# Valid channel types for closers
 valid_types = ['🏠🏃 Hybrid', '🏃 Field Marketing', '🏠 Web To Home']
-merged_df['TYPE'] = merged_df['TYPE'].apply(lambda x: x if x in valid_types else '🏠🏃 Hybrid')
 
-# Ensure 'MARKET' column has valid options
+# The page's frames from the shared snapshot, see WarmStart
+@st.cache_resource
+def get_warm_start():
+    return WarmStart(shared_backend(), 'targets', {
+        'users': lambda: session.for_stage('refresh_users', 'background').sql(users_query).to_pandas(),
+        'markets': lambda: session.for_stage('refresh_markets', 'background').sql(markets_query).to_pandas(),
+        'profile_pictures': lambda: session.for_stage('refresh_profile_pictures', 'background').sql(profile_picture_query).to_pandas(),
+        'appointments': lambda: session.for_stage('refresh_appointments', 'background').sql(appointments_query).to_pandas(),
+    }, max_age=600)
+
+# Load data through the result cache; data_version only picks the source.
+# Sessions that just saved need fresh data, so they bypass the snapshot.
+def load_frame(name, loader, data_version):
+    if data_version == 0:
+        return get_warm_start().frames()[name]
+    return loader()
+
+df_markets = load_frame('markets', get_market, st.session_state['data_version'])
 valid_market_types = df_markets['MARKET'].unique()
-merged_df['MARKET'] = merged_df['MARKET'].apply(lambda x: x if x in valid_market_types else 'No Market')
 
-# Prepare the dataframe for editing
-edit_df = merged_df[['PROFILE_PICTURE', 'FULL_NAME', 'MARKET', 'TYPE', 'ACTIVE', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK', 'SALESFORCE_ID']].copy()
+# Build the editor dataframe from users, appointments and profile pictures
+def build_edit_df(data_version):
+    df_users = load_frame('users', get_users, data_version)
+    profile_picture = load_frame('profile_pictures', get_profile_pictures, data_version)
+    appointments = load_frame('appointments', get_appointments, data_version)
+
+    # Merge the dataframes on the full name
+    merged_df = df_users.merge(
+        appointments, left_on='FULL_NAME', right_on='NAME', how='left'
+    ).merge(
+        profile_picture, on='FULL_NAME', how='left'
+    )
+
+    # Rename and drop columns as needed
+    merged_df = merged_df.rename(columns={
+        'FULL_NAME': 'FULL_NAME',
+        'PROFILE_PICTURE_y': 'PROFILE_PICTURE'
+    })
+
+    if 'CLOSER' in merged_df.columns:
+        merged_df = merged_df.drop(columns=['CLOSER'])
+
+    # Fill NaN values and ensure correct data types
+    merged_df['MARKET'] = merged_df['MARKET'].fillna('No Market').astype(str)
+    merged_df['GOAL'] = merged_df['GOAL'].fillna(0).astype(int)
+    merged_df['RANK'] = merged_df['RANK'].fillna(100).astype(int)
+    merged_df['FM_GOAL'] = merged_df['FM_GOAL'].fillna(0).astype(int)
+    merged_df['FM_RANK'] = merged_df['FM_RANK'].fillna(100).astype(int)
+    merged_df['TYPE'] = merged_df['TYPE'].fillna('🏠🏃 Hybrid').astype(str)
+    merged_df['PROFILE_PICTURE'] = merged_df['PROFILE_PICTURE'].fillna('https://i.ibb.co/ZNK5xmN/pdycc8-1-removebg-preview.png').astype(str)
+
+    # Convert 'ACTIVE' column to boolean
+    merged_df['ACTIVE'] = merged_df['ACTIVE'].fillna('No').astype(str)
+    merged_df['ACTIVE'] = merged_df['ACTIVE'].str.strip().str.lower().map({'yes': True, 'no': False})
+    merged_df['ACTIVE'] = merged_df['ACTIVE'].fillna(False)
 
-# Initialize session state
+    # Ensure 'TYPE' column has valid options
+    merged_df['TYPE'] = merged_df['TYPE'].apply(lambda x: x if x in valid_types else '🏠🏃 Hybrid')
+
+    # Ensure 'MARKET' column has valid options
+    merged_df['MARKET'] = merged_df['MARKET'].apply(lambda x: x if x in valid_market_types else 'No Market')
+
+    # Keep the row version so saves can detect concurrent edits
+    merged_df['TIMESTAMP'] = merged_df['TIMESTAMP'].map(format_version)
+
+    # Prepare the dataframe for editing
+    return merged_df[['PROFILE_PICTURE', 'FULL_NAME', 'MARKET', 'TYPE', 'ACTIVE', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK', 'SALESFORCE_ID', 'TIMESTAMP']].copy()
+
+# Initialize session state. The full tables are only read once per session;
+# saves patch the rows they touch instead of reloading everything.
 if 'filtered_edit_df' not in st.session_state:
-    st.session_state['filtered_edit_df'] = edit_df.copy()
+    st.session_state['filtered_edit_df'] = build_edit_df(st.session_state['data_version'])
 
 # Display the editable dataframe
 st.warning("ⓘ This page is for managers only. If you're not a manager or responsible for updating closer targets, please use the appointments page only.")
@@ -233,8 +262,49 @@ with st.form('editor_form'):
     # Add a submit button within the form
     submitted = st.form_submit_button('Save changes')
 
+# Columns a manager can change on the closer targets editor
+editable_columns = ['MARKET', 'TYPE', 'ACTIVE', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK']
+
+# Convert a row from the appointments table into editor values
+def server_row_values(server_row):
+    market = server_row['MARKET'] if server_row['MARKET'] in valid_market_types else 'No Market'
+    closer_type = server_row['TYPE'] if server_row['TYPE'] in valid_types else '🏠🏃 Hybrid'
+    return {
+        'MARKET': market,
+        'TYPE': closer_type,
+        'ACTIVE': str(server_row['ACTIVE']).strip().lower() == 'yes',
+        'GOAL': 0 if pd.isna(server_row['GOAL']) else int(server_row['GOAL']),
+        'RANK': 100 if pd.isna(server_row['RANK']) else int(server_row['RANK']),
+        'FM_GOAL': 0 if pd.isna(server_row['FM_GOAL']) else int(server_row['FM_GOAL']),
+        'FM_RANK': 100 if pd.isna(server_row['FM_RANK']) else int(server_row['FM_RANK']),
+        'TIMESTAMP': server_row['TIMESTAMP'],
+    }
+
+# Convert an edited (stringified) editor row into typed editor values
+def edited_row_values(row):
+    return {
+        'MARKET': row['MARKET'],
+        'TYPE': row['TYPE'],
+        'ACTIVE': row['ACTIVE'] == 'True',
+        'GOAL': int(float(row['GOAL'])),
+        'RANK': int(float(row['RANK'])),
+        'FM_GOAL': int(float(row['FM_GOAL'])),
+        'FM_RANK': int(float(row['FM_RANK'])),
+    }
+
+# Write values back into the cached editor dataframe
+def patch_edit_rows(full_name, values):
+    if 'filtered_edit_df' not in st.session_state:
+        return
+    edit_rows = st.session_state['filtered_edit_df']['FULL_NAME'] == full_name
+    for column, value in values.items():
+        st.session_state['filtered_edit_df'].loc[edit_rows, column] = value
+
 # Process the form submission
 if submitted:
+    # Capture the row versions before normalizing everything to strings
+    expected_versions = original_filtered_df['TIMESTAMP']
+
     # Normalize data types before comparison
     edited_df = edited_df.astype(str)
     original_filtered_df = original_filtered_df.astype(str)
@@ -249,59 +319,130 @@ if submitted:
     if changes.empty:
         st.info("No changes detected.")
     else:
-        # Update session state with new edited data
-        st.session_state['filtered_edit_df'].update(edited_df)
-        # After updating the database
-        if 'data_version' not in st.session_state:
-            st.session_state['data_version'] = 0
+        # Queue one write per changed closer; the queue batches and sends them in the background
+        changed_rows = changes.index.unique()
+        for idx in changed_rows:
+            row = edited_df.loc[idx]
+            values = edited_row_values(row)
+            save_queue.enqueue(
+                st.session_state['save_owner'],
+                'target',
+                row['FULL_NAME'],
+                {
+                    **values,
+                    'ACTIVE': 'Yes' if values['ACTIVE'] else 'No',
+                    'SALESFORCE_ID': row['SALESFORCE_ID'],
+                    'PROFILE_PICTURE': row['PROFILE_PICTURE'],
+                },
+                expected_versions.loc[idx],
+            )
+            # Show the edit right away; the row version is updated once the write lands
+            patch_edit_rows(row['FULL_NAME'], values)
+        st.toast(f"Saving changes for {len(changed_rows)} closer(s)...", icon="⏳")
+
+# Report finished background writes without blocking the editor
+@st.fragment(run_every=2)
+def save_status():
+    saved_count = 0
+    conflict_count = 0
+    for record in save_queue.collect(st.session_state['save_owner']):
+        if record['status'] == SAVED:
+            saved_count += 1
+            if record['kind'] == 'target':
+                patch_edit_rows(record['key'], {'TIMESTAMP': record['version']})
+        elif record['status'] == CONFLICT:
+            # Someone else saved this closer first: refresh the editor with what is
+            # in the table now and list both versions so the manager can re-apply
+            conflict_count += 1
+            mine_values = edited_row_values({**record['values'], 'ACTIVE': str(record['values']['ACTIVE'] == 'Yes')})
+            if record['current'] is not None:
+                current_values = server_row_values(record['current'])
+                patch_edit_rows(record['key'], current_values)
+            else:
+                current_values = {column: None for column in editable_columns}
+            for column in editable_columns:
+                if mine_values[column] != current_values[column]:
+                    st.session_state['save_conflicts'].append({
+                        'Name': record['key'],
+                        'Field': column,
+                        'Your Value': str(mine_values[column]),
+                        'Current Value': str(current_values[column]),
+                    })
+        elif record['status'] == FAILED:
+            st.toast(f"Error saving changes for {record['key']}: {record['message']}", icon="❌")
+        elif record['status'] == SUPERSEDED:
+            st.toast(f"A newer save replaced your change for {record['key']}", icon="ℹ️")
+
+    if saved_count:
+        st.toast(f"Saved {saved_count} change(s)", icon="✅")
+        # Show this manager fresh data instead of the snapshot; the queue has
+        # already invalidated the saved data for everyone
         st.session_state['data_version'] += 1
 
-        # Accumulate queries for batch execution
-        queries = []
-        for idx in changes.index.unique():
-            row = edited_df.loc[idx]
-            full_name = row['FULL_NAME'].replace("'", "''")
-            new_goal = int(row['GOAL'])
-            new_rank = int(row['RANK'])
-            fm_goal = int(row['FM_GOAL'])
-            fm_rank = int(row['FM_RANK'])
-            new_active = row['ACTIVE']
-            new_type = row['TYPE']
-            new_market = row['MARKET']
-            profile_picture = row['PROFILE_PICTURE']
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            active_str = 'Yes' if new_active == 'True' else 'No'
-
-            query = f"""
-            MERGE INTO raw.snowflake.lm_appointments AS target
-            USING (SELECT '{full_name}' AS NAME) AS source
-            ON target.NAME = source.NAME
-            WHEN MATCHED THEN
-                UPDATE SET
-                    GOAL = {new_goal},
-                    RANK = {new_rank},
-                    FM_GOAL = {fm_goal},
-                    FM_RANK = {fm_rank},
-                    ACTIVE = '{active_str}',
-                    TYPE = '{new_type}',
-                    MARKET = '{new_market}',
-                    TIMESTAMP = '{timestamp}',
-                    PROFILE_PICTURE = '{profile_picture}'
-            WHEN NOT MATCHED THEN
-                INSERT (CLOSER_ID, NAME, GOAL, RANK, FM_GOAL, FM_RANK, ACTIVE, TYPE, MARKET, TIMESTAMP, PROFILE_PICTURE)
-                VALUES ('{row['SALESFORCE_ID']}', '{full_name}', {new_goal}, {new_rank}, {fm_goal}, {fm_rank}, '{active_str}', '{new_type}', '{new_market}', '{timestamp}', '{profile_picture}');
-            """
-            queries.append(query)
-
-        # Execute all queries in a batch
-        with st.spinner('Saving changes...'):
-            for query in queries:
+    # The editor sits outside this fragment, so redraw the page to show the
+    # values the conflicts were patched with
+    if conflict_count:
+        st.rerun(scope="app")
+
+    pending_count = save_queue.pending_count(st.session_state['save_owner'])
+    if pending_count:
+        st.caption(f"⏳ Saving {pending_count} change(s) in the background...")
+
+    if st.session_state['save_conflicts']:
+        st.warning("Some closers were changed by another manager while you were editing. "
+                   "The editor now shows their latest values; re-apply any of your changes you still want.")
+        st.dataframe(pd.DataFrame(st.session_state['save_conflicts']), hide_index=True, use_container_width=True)
+        if st.button('Dismiss', key='dismiss_conflicts'):
+            st.session_state['save_conflicts'] = []
+            st.rerun()
+
+save_status()
+
+# --- Bulk Import ---
+with st.expander("📤 Bulk import closer targets"):
+    st.caption(
+        "Upload a CSV or Excel file with a NAME column and any of "
+        + ", ".join(target_import.TARGET_COLUMNS)
+        + ". Blank cells keep the current value; the last row for a closer wins."
+    )
+    targets_file = st.file_uploader('Targets file', type=['csv', 'xlsx'], key='targets_file')
+    if targets_file is not None and st.button('Import targets', key='import_targets'):
+        local_path = None
+        try:
+            with st.spinner('Validating file...'):
+                local_path, valid_count, rejected = target_import.stage_locally(
+                    targets_file,
+                    load_frame('users', get_users, st.session_state['data_version']),
+                    valid_market_types,
+                    valid_types,
+                )
+            if valid_count:
+                # The import's temporary stage and table live in their own session,
+                # so concurrent imports never share them
+                import_session = GovernedSession(connection.create_snowflake_session(st.secrets), 'targets',
+                                                 'import', page_setup.current_user())
                 try:
-                    session.sql(query).collect()
-                    st.success(f"Saved changes for {row['FULL_NAME']}")
-                except Exception as e:
-                    st.error(f"Error saving changes for {row['FULL_NAME']}: {str(e)}")
+                    with st.spinner(f'Importing {valid_count} rows...'):
+                        target_import.apply_import(import_session, local_path)
+                finally:
+                    import_session.close()
+                st.success(f"Imported {valid_count} rows.")
+                # Rebuild the editor from the table on the next run
+                st.session_state['data_version'] += 1
+                invalidate_saved_data()
+                st.session_state.pop('filtered_edit_df', None)
+            if len(rejected):
+                st.warning(f"Skipped {len(rejected)} rows that did not validate.")
+                st.dataframe(rejected.head(500), hide_index=True, use_container_width=True)
+                st.download_button('Download skipped rows', rejected.to_csv(index=False),
+                                   file_name='skipped_targets.csv', mime='text/csv')
+        except ValueError as e:
+            st.error(str(e))
+        except Exception as e:
+            st.error(f"Error importing targets: {str(e)}")
+        finally:
+            if local_path is not None and os.path.exists(local_path):
+                os.remove(local_path)
 
 # --- Market Form ---
 st.divider()
@@ -326,6 +467,31 @@ with st.form('market_editor_form'):
 
     submitted_market = st.form_submit_button('Save Changes')
 
+# Convert an edited market row into the values queued for saving
+def market_row_values(row):
+    # Handle 'MARKET_GROUP' field
+    market_group = row.get('MARKET_GROUP', '')
+    if pd.isna(market_group):
+        market_group = ''
+
+    # Handle 'RANK' field
+    rank = row.get('RANK', '')
+    if pd.isna(rank) or rank == '':
+        rank_value = None
+    else:
+        try:
+            rank_value = int(rank)
+        except (ValueError, TypeError):
+            st.error(f"Invalid rank value for market '{row['MARKET']}'. Rank must be an integer.")
+            return None
+
+    # Handle 'NOTES' field
+    notes = row.get('NOTES', '')
+    if pd.isna(notes):
+        notes = ''
+
+    return {'ACTION': 'upsert', 'MARKET_GROUP': market_group, 'RANK': rank_value, 'NOTES': notes}
+
 if submitted_market:
     # Reset index for comparison
     edited_market_df = edited_market_df.reset_index(drop=True)
@@ -339,14 +505,12 @@ if submitted_market:
     deleted_markets = original_markets - edited_markets
     common_markets = original_markets & edited_markets
 
-    # Initialize lists to store queries
-    queries = []
+    # Initialize list of market writes to queue
+    market_writes = []
 
     # Handle deleted markets
     for market in deleted_markets:
-        market_safe = market.replace("'", "''")
-        query = f"DELETE FROM raw.snowflake.lm_markets WHERE MARKET = '{market_safe}';"
-        queries.append((query, f"Deleted market '{market}'"))
+        market_writes.append((market, {'ACTION': 'delete'}))
 
     # Handle new markets
     new_markets_df = edited_market_df[edited_market_df['MARKET'].isin(new_markets)]
@@ -356,38 +520,9 @@ if submitted_market:
         if pd.isna(market) or market == '':
             st.error("Market name cannot be empty.")
             continue  # Skip this row
-        market = market.replace("'", "''")
-
-        # Handle 'MARKET_GROUP' field
-        market_group = row.get('MARKET_GROUP', '')
-        if pd.isna(market_group):
-            market_group = ''
-        market_group = market_group.replace("'", "''")
-
-        # Handle 'RANK' field
-        rank = row.get('RANK', '')
-        if pd.isna(rank) or rank == '':
-            rank_value = 'NULL'
-        else:
-            try:
-                rank_value = int(rank)
-            except (ValueError, TypeError):
-                st.error(f"Invalid rank value for market '{market}'. Rank must be an integer.")
-                continue  # Skip this row
-
-        # Handle 'NOTES' field
-        notes = row.get('NOTES', '')
-        if pd.isna(notes):
-            notes = ''
-        notes = notes.replace("'", "''")
-
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        query = f"""
-        INSERT INTO raw.snowflake.lm_markets (MARKET, MARKET_GROUP, RANK, NOTES, TIMESTAMP)
-        VALUES ('{market}', '{market_group}', {rank_value}, '{notes}', '{timestamp}');
-        """
-        queries.append((query, f"Inserted new market '{market}'"))
+        values = market_row_values(row)
+        if values is not None:
+            market_writes.append((market, values))
 
     # Handle updated markets
     for market in common_markets:
@@ -398,55 +533,25 @@ if submitted_market:
         # Compare rows (excluding 'MARKET' as it's the key)
         columns_to_compare = ['MARKET_GROUP', 'RANK', 'NOTES']
         if not edited_row[columns_to_compare].equals(original_row[columns_to_compare]):
-            # There are changes
-            market_safe = market.replace("'", "''")
-
-            # Handle 'MARKET_GROUP' field
-            market_group = edited_row.get('MARKET_GROUP', '')
-            if pd.isna(market_group):
-                market_group = ''
-            market_group = market_group.replace("'", "''")
-
-            # Handle 'RANK' field
-            rank = edited_row.get('RANK', '')
-            if pd.isna(rank) or rank == '':
-                rank_value = 'NULL'
-            else:
-                try:
-                    rank_value = int(rank)
-                except (ValueError, TypeError):
-                    st.error(f"Invalid rank value for market '{market}'. Rank must be an integer.")
-                    continue  # Skip this row
-
-            # Handle 'NOTES' field
-            notes = edited_row.get('NOTES', '')
-            if pd.isna(notes):
-                notes = ''
-            notes = notes.replace("'", "''")
-
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            query = f"""
-            UPDATE raw.snowflake.lm_markets
-            SET MARKET_GROUP = '{market_group}', RANK = {rank_value}, NOTES = '{notes}', TIMESTAMP = '{timestamp}'
-            WHERE MARKET = '{market_safe}';
-            """
-            queries.append((query, f"Updated market '{market}'"))
-
-    # Execute all queries in a batch
-    if queries:
-        with st.spinner('Saving changes...'):
-            for query, message in queries:
-                try:
-                    session.sql(query).collect()
-                    st.success(message)
-                except Exception as e:
-                    st.error(f"Error processing {message}: {str(e)}")
-        # Reload data
-        df_markets = get_market(st.session_state['data_version'])
+            values = market_row_values(edited_row)
+            if values is not None:
+                market_writes.append((market, values))
+
+    # Queue all market writes; they are flushed together in the background
+    if market_writes:
+        for market, values in market_writes:
+            save_queue.enqueue(st.session_state['save_owner'], 'market', market, values)
+        st.toast(f"Saving changes for {len(market_writes)} market(s)...", icon="⏳")
     else:
         st.info("No changes detected.")
-    # After updating the database
-    if 'data_version' not in st.session_state:
-        st.session_state['data_version'] = 0
-    st.session_state['data_version'] += 1
+
+# --- Result cache statistics, for sizing RESULT_CACHE_MB ---
+with st.expander("📊 Result cache"):
+    cache_stats = result_cache.stats()
+    stat_cols = st.columns(4)
+    stat_cols[0].metric('Memory', f"{cache_stats['bytes'] / 2 ** 20:.1f} / {cache_stats['max_bytes'] / 2 ** 20:.0f} MB")
+    stat_cols[1].metric('Entries', cache_stats['entries'])
+    stat_cols[2].metric('Hit rate', f"{cache_stats['hit_rate']:.0%}")
+    stat_cols[3].metric('Evictions', cache_stats['evictions'])
+    st.caption(f"{cache_stats['hits']} hits, {cache_stats['coalesced']} coalesced and {cache_stats['misses']} misses; "
+               f"{cache_stats['oversized']} results were too large to keep.")
@@ -0,0 +1,3 @@
+import leaderboard_page
+
+leaderboard_page.render('fm')
@@ -0,0 +1,230 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+
+from snapshot_store import SNAPSHOT_DIR, SnapshotStore
+
+# Where replicas share frames and data versions:
+#   unset or file:///path  - a directory every replica mounts (SNAPSHOT_DIR by default)
+#   redis://host:port/db   - a Redis server, needs the redis package
+#   local://               - an in-process stand-in for Redis, for development
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL', '')
+
+
+# Frames travel through Redis as Arrow IPC streams, the same format as the Feather files
+def frame_to_bytes(df):
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def frame_from_bytes(data):
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+class FileBackend:
+    # Shared state in a directory: frames as SnapshotStore generations, data
+    # versions in versions.json and cross-process locks with fcntl.flock.
+    # The directory must be on a filesystem with working flock, i.e. local
+    # disk or a volume the replicas share on one host.
+
+    def __init__(self, directory=SNAPSHOT_DIR, keep=3):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def versions_path(self):
+        return os.path.join(self.directory, 'versions.json')
+
+    def _read_versions(self):
+        try:
+            with open(self.versions_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def version(self, namespace):
+        return self._read_versions().get(namespace, 0)
+
+    # Mark the data of the namespaces as changed for every replica
+    def bump(self, *namespaces):
+        with self.lock('versions'):
+            versions = self._read_versions()
+            for namespace in namespaces:
+                versions[namespace] = versions.get(namespace, 0) + 1
+            temp_path = f'{self.versions_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(versions, f)
+            os.replace(temp_path, self.versions_path)
+
+    # Hold the named lock across processes; yields False if it was not acquired
+    # within `timeout` seconds, so callers can decide to go ahead anyway
+    @contextlib.contextmanager
+    def lock(self, name, timeout=120):
+        import fcntl
+
+        lock_dir = os.path.join(self.directory, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f'{name}.lock'), 'w') as f:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        acquired = False
+                        break
+                    time.sleep(0.05)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save_frames(self, namespace, frames, version):
+        with self.lock(f'manifest-{namespace}'):
+            SnapshotStore(namespace, self.directory, self.keep).save(frames, version)
+
+    # Return (frames, info) of the newest snapshot, info holding its created_at
+    # and version, or (None, None) if there is none
+    def load_frames(self, namespace):
+        return SnapshotStore(namespace, self.directory, self.keep).load_entry()
+
+
+class RedisBackend:
+    # Shared state in Redis. Versions are counters, locks are SET NX keys with an
+    # expiry, and each save writes the frames of a new generation before pointing
+    # the namespace's meta key at it, so readers never see a half-written snapshot.
+    # Older generations expire on their own after `retention` seconds.
+
+    def __init__(self, client, prefix='appointment-dashboard', retention=86400):
+        self.client = client
+        self.prefix = prefix
+        self.retention = retention
+
+    def version(self, namespace):
+        return int(self.client.get(f'{self.prefix}:version:{namespace}') or 0)
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            self.client.incr(f'{self.prefix}:version:{namespace}')
+
+    @contextlib.contextmanager
+    def lock(self, name, timeout=120):
+        key = f'{self.prefix}:lock:{name}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        # The expiry frees the lock if its holder dies
+        while not (acquired := bool(self.client.set(key, token, nx=True, px=int(timeout * 1000)))):
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        try:
+            yield acquired
+        finally:
+            if acquired and self.client.get(key) in (token, token.encode()):
+                self.client.delete(key)
+
+    def save_frames(self, namespace, frames, version):
+        generation = uuid.uuid4().hex
+        for name, df in frames.items():
+            self.client.set(f'{self.prefix}:frames:{namespace}:{generation}:{name}', frame_to_bytes(df),
+                            ex=self.retention)
+        meta = {'generation': generation, 'created_at': time.time(), 'version': version, 'frames': list(frames)}
+        self.client.set(f'{self.prefix}:meta:{namespace}', json.dumps(meta))
+
+    def load_frames(self, namespace):
+        meta = self.client.get(f'{self.prefix}:meta:{namespace}')
+        if meta is None:
+            return None, None
+        meta = json.loads(meta)
+        frames = {}
+        for name in meta['frames']:
+            data = self.client.get(f'{self.prefix}:frames:{namespace}:{meta["generation"]}:{name}')
+            if data is None:
+                return None, None
+            frames[name] = frame_from_bytes(data)
+        return frames, meta
+
+
+class LocalRedis:
+    # In-process stand-in for the few Redis commands RedisBackend uses
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}   # key -> (value, expires_at or None)
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry is not None else None
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            expires_at = None
+            if px is not None:
+                expires_at = time.monotonic() + px / 1000
+            elif ex is not None:
+                expires_at = time.monotonic() + ex
+            self._data[key] = (value, expires_at)
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry is not None else 1
+            self._data[key] = (value, entry[1] if entry is not None else None)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
+
+
+# Build the backend named by a SHARED_CACHE_URL value
+def create_backend(url):
+    if not url:
+        return FileBackend()
+    if url.startswith('file://'):
+        return FileBackend(url[len('file://'):])
+    if url.startswith('local://'):
+        return RedisBackend(LocalRedis())
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("SHARED_CACHE_URL points at Redis, which needs the redis package.")
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported SHARED_CACHE_URL '{url}'")
+
+
+_shared_backend = None
+_shared_backend_lock = threading.Lock()
+
+
+# The backend every page and WarmStart in this process uses
+def shared_backend():
+    global _shared_backend
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            _shared_backend = create_backend(SHARED_CACHE_URL)
+        return _shared_backend
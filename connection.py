@@ -0,0 +1,127 @@
+import contextlib
+import os
+import threading
+
+# Set OFFLINE_DATA=1 to run the pages against generated data instead of Snowflake,
+# e.g. for local development and load testing
+OFFLINE = os.environ.get('OFFLINE_DATA', '') not in ('', '0')
+
+# Snowflake error numbers meaning the session itself is gone: no longer exists,
+# expired, authentication token expired, connection closed
+EXPIRED_SESSION_ERRORS = {390111, 390112, 390114, 250002}
+
+
+# Create a Snowflake session from the app secrets (st.secrets or the parsed secrets.toml)
+def create_snowflake_session(secrets):
+    if OFFLINE:
+        from offline_session import OfflineSession
+        return OfflineSession()
+
+    from snowflake.snowpark import Session
+    connection_parameters = {
+        "account": secrets["snowflake"]["account"],
+        "user": secrets["snowflake"]["user"],
+        "password": secrets["snowflake"]["password"],
+        "role": secrets["snowflake"]["role"],
+        "warehouse": secrets["snowflake"]["warehouse"],
+        "database": secrets["snowflake"]["database"],
+        "schema": secrets["snowflake"]["schema"],
+        # Heartbeats keep idle sessions from expiring between page views
+        "client_session_keep_alive": True,
+    }
+    return Session.builder.configs(connection_parameters).create()
+
+
+# Whether an error from a statement means its session has to be replaced
+def session_expired(error):
+    while error is not None:
+        if (getattr(error, 'sql_error_code', None) or getattr(error, 'errno', None)) in EXPIRED_SESSION_ERRORS:
+            return True
+        error = error.__cause__ or getattr(error, 'conn_error', None)
+    return False
+
+
+class SessionPool:
+    # Snowflake sessions shared by the threads of a process. Snowpark 1.11
+    # sessions are not thread-safe, so each statement borrows an idle session for
+    # itself. A session is created only when none is idle and fewer than
+    # `max_sessions` are open; otherwise the statement waits for one to come back,
+    # so sessions are logged in once and then reused. When a session fails
+    # because it expired, it is closed along with the idle ones, which have been
+    # idle as long, so the next statements log in again.
+
+    def __init__(self, factory, max_sessions=4):
+        self._factory = factory
+        self._max_sessions = max_sessions
+        self._available = threading.Condition()
+        self._idle = []
+        self._open = 0
+
+    @contextlib.contextmanager
+    def checkout(self):
+        session = self._borrow()
+        try:
+            yield session
+        except Exception as e:
+            if session_expired(e):
+                self._discard(session)
+                self.close()
+            else:
+                self._checkin(session)
+            raise
+        except BaseException:
+            self._checkin(session)
+            raise
+        self._checkin(session)
+
+    def _borrow(self):
+        with self._available:
+            while not self._idle and self._open >= self._max_sessions:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            return self._factory()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def _checkin(self, session):
+        with self._available:
+            self._idle.append(session)
+            self._available.notify()
+
+    def _discard(self, session):
+        close_quietly(session)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def close(self):
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._available.notify_all()
+        for session in idle:
+            close_quietly(session)
+
+
+# Borrow a session for one statement: from a pool, or the given session itself
+@contextlib.contextmanager
+def checkout(session):
+    if isinstance(session, SessionPool):
+        with session.checkout() as pooled:
+            yield pooled
+    else:
+        yield session
+
+
+def close_quietly(session):
+    try:
+        session.close()
+    except Exception:
+        pass
@@ -0,0 +1,269 @@
+import html
+import math
+
+import numpy as np
+import pandas as pd
+
+# Timeframes shown on the appointment pages, in selectbox order
+TIMEFRAMES = ['This Week', 'Next Week', 'Last Week']
+
+DEFAULT_PROFILE_PICTURE = 'https://i.ibb.co/ZNK5xmN/pdycc8-1-removebg-preview.png'
+
+# Progress bar colors for closers below and at their goal
+BELOW_GOAL_COLOR = '#FF6347'
+AT_GOAL_COLOR = '#47C547'
+
+# Styles for the closer cards, shared by the pages and the exported HTML
+CARD_CSS = """
+.card {
+    background-color: #1e1e1e;
+    padding: 10px;
+    border-radius: 10px;
+    margin-bottom: 5px;
+    color: white;
+    position: relative;
+}
+.profile-section {
+    display: flex;
+    align-items: center;
+    margin-bottom: 8px;
+}
+.profile-pic {
+    border-radius: 50%;
+    width: 28px;
+    height: 28px;
+    margin-right: 15px;
+}
+.name {
+    font-size: 16px; /* Reduced from 18px for smaller titles */
+    font-weight: bold;
+}
+.appointments {
+    font-size: 16px;
+    margin-bottom: 10px;
+    color: white;
+}
+.progress-bar {
+    background-color: #333;
+    border-radius: 25px;
+    width: 100%;
+    height: 20px;
+    position: relative;
+    margin-bottom: 10px;
+}
+.progress-bar-fill {
+    background-color: #FF6347;
+    height: 100%;
+    border-radius: 25px;
+}
+.goal {
+    position: absolute;
+    right: 5px;
+    top: 50%;
+    transform: translateY(-50%);
+    font-size: 16px;
+    color: white;
+    font-weight: bold;
+}
+"""
+
+# Everything that differs between the Web and Field appointment pages
+CHANNELS = {
+    'web': {
+        'goal_column': 'GOAL',
+        'rank_column': 'RANK',
+        'types': ('🏠🏃 Hybrid', '🏠 Web To Home'),
+        'sales_channel': 'Web To Home',
+    },
+    'fm': {
+        'goal_column': 'FM_GOAL',
+        'rank_column': 'FM_RANK',
+        'types': ('🏠🏃 Hybrid', '🏃 Field Marketing'),
+        'sales_channel': 'Outside Sales',
+    },
+}
+
+
+# Active closers of the channel with their market, one row per timeframe
+def goals_query(channel):
+    config = CHANNELS[channel]
+    types_list = ', '.join(f"'{closer_type}'" for closer_type in config['types'])
+    return f"""
+    SELECT
+    b.MARKET_GROUP,
+    b.RANK AS MARKET_RANK,
+    b.NOTES,
+    a.{config['goal_column']},
+    a.MARKET,
+    a.TYPE,
+    a.{config['rank_column']},
+    a.ACTIVE,
+    a.CLOSER_ID,
+    a.PROFILE_PICTURE,
+    CONCAT(SPLIT_PART(a.NAME, ' ', 1), ' ', LEFT(SPLIT_PART(a.NAME, ' ', 2), 1), '.') AS NAME,
+    TIMEFRAME
+FROM
+    raw.snowflake.lm_appointments a
+LEFT JOIN
+    raw.snowflake.lm_markets b
+    ON a.MARKET = b.MARKET
+JOIN (SELECT 'This Week' AS timeframe UNION ALL SELECT 'Last Week' AS timeframe UNION ALL SELECT 'Next Week' AS timeframe)
+WHERE
+    a.ACTIVE = 'Yes'
+    AND a.TYPE IN ({types_list})
+"""
+
+
+# Appointment counts per closer for last, this and next week. The text only
+# changes with the channel, so repeats are served from Snowflake's result cache.
+def appts_query(channel):
+    config = CHANNELS[channel]
+    return f"""
+    SELECT owner_id closer_id, COUNT(first_scheduled_close_start_date_time_c) APPOINTMENTS, CASE
+        WHEN WEEK(first_scheduled_close_start_date_time_c) = WEEK(DATEADD("day", -7, CURRENT_DATE()))
+            AND YEAR(first_scheduled_close_start_date_time_c) = YEAR(DATEADD("day", -7, CURRENT_DATE())) THEN 'Last Week'
+        WHEN WEEK(first_scheduled_close_start_date_time_c) = WEEK(CURRENT_DATE())
+            AND YEAR(first_scheduled_close_start_date_time_c) = YEAR(CURRENT_DATE) THEN 'This Week'
+        WHEN WEEK(first_scheduled_close_start_date_time_c) = WEEK(DATEADD("day", 7, CURRENT_DATE()))
+            AND YEAR(first_scheduled_close_start_date_time_c) = YEAR(DATEADD("day", 7, CURRENT_DATE())) THEN 'Next Week'
+    END timeframe
+    FROM raw.salesforce.opportunity
+    WHERE sales_channel_c = '{config['sales_channel']}'
+    AND timeframe IS NOT NULL
+    GROUP BY closer_id, timeframe
+"""
+
+
+# Build the sorted leaderboard of every timeframe in one pass.
+#
+# The channel's goal and rank columns come back as GOAL and RANK, alongside
+# PERCENTAGE_TO_GOAL and PROGRESS_COLOR for the cards. Rows are ordered by
+# MARKET_RANK, MARKET and RANK, so each market's closers are contiguous.
+def build_leaderboards(df_goals, df_appts, channel):
+    config = CHANNELS[channel]
+    df = pd.merge(df_goals, df_appts, on=['CLOSER_ID', 'TIMEFRAME'], how='left')
+    df = df.rename(columns={config['goal_column']: 'GOAL', config['rank_column']: 'RANK'})
+
+    df['TIMEFRAME'] = df['TIMEFRAME'].fillna('This Week').astype(str)
+    df['APPOINTMENTS'] = df['APPOINTMENTS'].fillna(0).astype(int)
+    df['GOAL'] = df['GOAL'].fillna(0).astype(int)
+    df['RANK'] = df['RANK'].fillna(100).astype(int)
+    df['PROFILE_PICTURE'] = df['PROFILE_PICTURE'].fillna(DEFAULT_PROFILE_PICTURE).astype(str)
+    df['MARKET_GROUP'] = df['MARKET_GROUP'].fillna('No Group').astype(str)
+
+    # A goal of 0 counts as met; otherwise cap the percentage at 100
+    goal = df['GOAL'].to_numpy()
+    appointments = df['APPOINTMENTS'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage = np.where(goal == 0, 100.0, np.minimum(appointments / goal * 100, 100.0))
+    df['PERCENTAGE_TO_GOAL'] = percentage
+    df['PROGRESS_COLOR'] = np.where(percentage < 100, BELOW_GOAL_COLOR, AT_GOAL_COLOR)
+
+    df = df.sort_values(by=['MARKET_RANK', 'MARKET', 'RANK'], kind='mergesort')
+
+    leaderboards = {timeframe: df.iloc[0:0] for timeframe in TIMEFRAMES}
+    for timeframe, timeframe_df in df.groupby('TIMEFRAME', sort=False):
+        leaderboards[timeframe] = timeframe_df
+    return leaderboards
+
+
+# All market groups across the timeframes, for the group filter
+def market_groups(leaderboards):
+    groups = set()
+    for df in leaderboards.values():
+        groups.update(df['MARKET_GROUP'].unique())
+    return sorted(groups)
+
+
+# Split a timeframe's leaderboard into one block per market, keeping the
+# MARKET_RANK order. Each block holds the market's group, notes and card rows.
+def build_market_blocks(df):
+    df = df[df['MARKET'].notna()]
+    markets = df['MARKET'].to_numpy()
+    starts = np.flatnonzero(np.append(True, markets[1:] != markets[:-1])) if len(markets) else np.array([], dtype=int)
+    stops = np.append(starts[1:], len(markets))
+    records = df.to_dict('records')
+
+    blocks = []
+    for start, stop in zip(starts, stops):
+        notes = df['NOTES'].iloc[start:stop].dropna()
+        blocks.append({
+            'market': markets[start],
+            'group': records[start]['MARKET_GROUP'],
+            'notes': notes.iloc[0] if len(notes) else '',
+            'cards': records[start:stop],
+        })
+    return blocks
+
+
+# Assign market blocks to page columns, each going to the currently shortest
+# column (a header plus its card rows), so columns stay balanced in rank order
+def place_markets(blocks, columns=2, cards_per_row=3):
+    heights = [0] * columns
+    placement = [[] for _ in range(columns)]
+    for block in blocks:
+        target = heights.index(min(heights))
+        placement[target].append(block)
+        heights[target] += 1 + math.ceil(len(block['cards']) / cards_per_row)
+    return placement
+
+
+# Market blocks and their unfiltered placement for every timeframe
+def build_layouts(leaderboards, columns=2, cards_per_row=3):
+    layouts = {}
+    for timeframe, df in leaderboards.items():
+        blocks = build_market_blocks(df)
+        layouts[timeframe] = {
+            'blocks': blocks,
+            'placement': place_markets(blocks, columns, cards_per_row),
+        }
+    return layouts
+
+
+# A card's identity across refreshes
+def card_key(card):
+    return (card['CLOSER_ID'], card['TIMEFRAME'])
+
+
+# Which markets and cards sit where. Cards are ordered by rank, not by count,
+# so only target and market edits change this.
+def placement_signature(placement):
+    return tuple(
+        tuple((block['market'], tuple(card_key(card) for card in block['cards'])) for block in column_blocks)
+        for column_blocks in placement
+    )
+
+
+# The values a refresh can change on a card in place, by card key
+def card_values(placement):
+    return {
+        card_key(card): (card['APPOINTMENTS'], card['GOAL'])
+        for column_blocks in placement for block in column_blocks for card in block['cards']
+    }
+
+
+# Cards of `placement` whose appointments or goal differ from `previous_values`
+def changed_cards(placement, previous_values):
+    return [
+        card
+        for column_blocks in placement for block in column_blocks for card in block['cards']
+        if previous_values.get(card_key(card)) != (card['APPOINTMENTS'], card['GOAL'])
+    ]
+
+
+# HTML of one closer card, with optional extra markup (e.g. a sparkline) at the bottom
+def card_html(card, extra_html=''):
+    return f"""
+        <div class="card">
+            <div class="profile-section">
+                <img src="{html.escape(card['PROFILE_PICTURE'])}" class="profile-pic" alt="Profile Picture">
+                <div class="name">{html.escape(str(card['NAME']))}</div>
+            </div>
+            <div class="appointments">{card['APPOINTMENTS']}</div>
+            <div class="progress-bar">
+                <div class="progress-bar-fill" style="width: {card['PERCENTAGE_TO_GOAL']}%;background-color: {card['PROGRESS_COLOR']};"></div>
+                <div class="goal">{card['GOAL']}</div>
+            </div>
+            {extra_html}
+        </div>
+    """
@@ -0,0 +1,260 @@
+"""Headless leaderboard export for office TVs and chat bots.
+
+Serves the same leaderboard as the appointment pages without a Streamlit session,
+from the same shared snapshot the pages keep warm (see cache_backend).
+
+    python leaderboard_export.py json --channel web --timeframe "This Week"
+    python leaderboard_export.py html --channel fm --group "North" -o fm.html
+    python leaderboard_export.py serve --port 8502
+
+The server answers GET /leaderboard/<channel>.json and /leaderboard/<channel>.html,
+with optional ?timeframe= and repeated ?group= parameters. Responses carry an
+ETag, so clients that send If-None-Match get an empty 304 until the data changes.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import connection
+import leaderboard
+from query_governor import GovernedSession, pool_size
+from cache_backend import shared_backend
+from snapshot_store import WarmStart
+
+SECRETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.streamlit', 'secrets.toml')
+
+# Same layout as the pages
+CARDS_PER_ROW = 3
+MARKET_COLUMNS = 2
+
+
+# Create a Snowflake session from the Streamlit secrets file
+def create_snowflake_session(secrets_path=SECRETS_PATH):
+    if connection.OFFLINE:
+        return connection.create_snowflake_session({})
+    try:
+        import tomllib
+        with open(secrets_path, 'rb') as f:
+            secrets = tomllib.load(f)
+    except ImportError:
+        import toml
+        secrets = toml.load(secrets_path)
+    return connection.create_snowflake_session(secrets)
+
+
+class LeaderboardExporter:
+    # Renders leaderboards as JSON or HTML, caching each rendering with its ETag
+    # until the channel's snapshot changes. One-shot exports pass block_if_stale,
+    # so a stale snapshot is refreshed before rendering rather than after exiting.
+
+    def __init__(self, session_factory=create_snowflake_session, max_age=600, block_if_stale=False):
+        # Sessions log in on first use and are replaced when they expire
+        sessions = connection.SessionPool(session_factory, max_sessions=pool_size('leaderboard_export'))
+        self._session = GovernedSession(sessions, 'leaderboard_export', user='export')
+        self._max_age = max_age
+        self._block_if_stale = block_if_stale
+        self._lock = threading.Lock()
+        self._warm_starts = {}
+        self._layouts = {}    # channel -> (generation, leaderboards, layouts)
+        self._rendered = {}   # (channel, generation, format, timeframe, groups) -> (etag, body)
+
+    def _query(self, query, stage):
+        return self._session.for_stage(stage).sql(query).to_pandas()
+
+    def _warm_start(self, channel):
+        with self._lock:
+            if channel not in self._warm_starts:
+                goals_query = leaderboard.goals_query(channel)
+                appts_query = leaderboard.appts_query(channel)
+                # Same shared snapshot as the appointment page of this channel
+                self._warm_starts[channel] = WarmStart(shared_backend(), f'{channel}_appointments', {
+                    'goals': lambda: self._query(goals_query, f'{channel}_goals'),
+                    'appts': lambda: self._query(appts_query, f'{channel}_appts'),
+                }, max_age=self._max_age)
+            return self._warm_starts[channel]
+
+    def layouts(self, channel):
+        warm_start = self._warm_start(channel)
+        frames = warm_start.frames(block_if_stale=self._block_if_stale)
+        generation = warm_start.generation
+        cached = self._layouts.get(channel)
+        if cached is None or cached[0] != generation:
+            leaderboards = leaderboard.build_leaderboards(frames['goals'], frames['appts'], channel)
+            layouts = leaderboard.build_layouts(leaderboards, MARKET_COLUMNS, CARDS_PER_ROW)
+            cached = (generation, leaderboards, layouts)
+            with self._lock:
+                self._layouts[channel] = cached
+                # Renderings of older generations can no longer be requested
+                self._rendered = {key: value for key, value in self._rendered.items()
+                                  if key[0] != channel or key[1] == generation}
+        return cached
+
+    # Return (etag, body) for one channel, format ('json' or 'html'), timeframe and groups
+    def render(self, channel, export_format, timeframe='This Week', groups=()):
+        if channel not in leaderboard.CHANNELS:
+            raise ValueError(f"Unknown channel '{channel}'")
+        if timeframe not in leaderboard.TIMEFRAMES:
+            raise ValueError(f"Unknown timeframe '{timeframe}'")
+
+        generation, _, layouts = self.layouts(channel)
+        key = (channel, generation, export_format, timeframe, tuple(sorted(groups)))
+        cached = self._rendered.get(key)
+        if cached is not None:
+            return cached
+
+        blocks = layouts[timeframe]['blocks']
+        if groups:
+            blocks = [block for block in blocks if block['group'] in groups]
+        if export_format == 'json':
+            body = json.dumps(leaderboard_json(channel, timeframe, blocks), default=str).encode('utf-8')
+        elif export_format == 'html':
+            placement = leaderboard.place_markets(blocks, MARKET_COLUMNS, CARDS_PER_ROW)
+            body = leaderboard_html(channel, timeframe, placement).encode('utf-8')
+        else:
+            raise ValueError(f"Unknown format '{export_format}'")
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            self._rendered[key] = (etag, body)
+        return etag, body
+
+
+# Plain data for bots: markets in rank order with their closers
+def leaderboard_json(channel, timeframe, blocks):
+    return {
+        'channel': channel,
+        'timeframe': timeframe,
+        'markets': [
+            {
+                'market': block['market'],
+                'group': block['group'],
+                'notes': block['notes'],
+                'closers': [
+                    {
+                        'name': card['NAME'],
+                        'appointments': int(card['APPOINTMENTS']),
+                        'goal': int(card['GOAL']),
+                        'percentage_to_goal': float(card['PERCENTAGE_TO_GOAL']),
+                        'profile_picture': card['PROFILE_PICTURE'],
+                    }
+                    for card in block['cards']
+                ],
+            }
+            for block in blocks
+        ],
+    }
+
+
+# A standalone page for kiosks, laid out like the Streamlit page
+def leaderboard_html(channel, timeframe, placement):
+    columns = []
+    for column_blocks in placement:
+        markets = []
+        for block in column_blocks:
+            cards = ''.join(leaderboard.card_html(card) for card in block['cards'])
+            markets.append(
+                f'<h2 title="{html.escape(str(block["notes"]))}">{html.escape(str(block["market"]))}</h2>'
+                f'<div class="cards">{cards}</div>'
+            )
+        columns.append(f'<div class="column">{"".join(markets)}</div>')
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(timeframe)} Appointments</title>
+<style>
+body {{ background-color: #0e1117; color: white; font-family: sans-serif; margin: 20px; }}
+.columns {{ display: grid; grid-template-columns: repeat({MARKET_COLUMNS}, 1fr); gap: 24px; }}
+.cards {{ display: grid; grid-template-columns: repeat({CARDS_PER_ROW}, 1fr); gap: 8px; }}
+{leaderboard.CARD_CSS}
+</style>
+</head>
+<body>
+<div class="columns">{"".join(columns)}</div>
+</body>
+</html>
+"""
+
+
+def make_handler(exporter):
+    class LeaderboardHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] != 'leaderboard' or '.' not in parts[1]:
+                self.send_error(404)
+                return
+            channel, export_format = parts[1].rsplit('.', 1)
+            query = parse_qs(url.query)
+
+            try:
+                etag, body = exporter.render(
+                    channel,
+                    export_format,
+                    timeframe=query.get('timeframe', ['This Week'])[0],
+                    groups=query.get('group', []),
+                )
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            content_type = 'application/json' if export_format == 'json' else 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            # Clients may keep the response but must revalidate it with the ETag
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+
+    return LeaderboardHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for export_format in ('json', 'html'):
+        export_parser = subparsers.add_parser(export_format, help=f'Print the leaderboard as {export_format.upper()}')
+        export_parser.add_argument('--channel', choices=sorted(leaderboard.CHANNELS), default='web')
+        export_parser.add_argument('--timeframe', choices=leaderboard.TIMEFRAMES, default='This Week')
+        export_parser.add_argument('--group', action='append', default=[], help='Market group to include (repeatable)')
+        export_parser.add_argument('-o', '--output', help='Write to this file instead of stdout')
+
+    serve_parser = subparsers.add_parser('serve', help='Serve leaderboards over HTTP')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=8502)
+
+    args = parser.parse_args(argv)
+    exporter = LeaderboardExporter(block_if_stale=args.command != 'serve')
+
+    if args.command == 'serve':
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(exporter))
+        print(f"Serving leaderboards on http://{args.host}:{args.port}/leaderboard/<channel>.<json|html>")
+        server.serve_forever()
+        return
+
+    _, body = exporter.render(args.channel, args.command, args.timeframe, args.group)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(body)
+    else:
+        sys.stdout.write(body.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import time
+
+import streamlit as st
+
+import connection
+import leaderboard
+import page_setup
+from cache_backend import shared_backend
+from query_governor import GovernedSession
+from result_cache import versioned_result
+from snapshot_store import WarmStart
+
+# Define the number of cards per row (e.g., 3, 4, 6) and of market columns
+CARDS_PER_ROW = 3
+MARKET_COLUMNS = 2
+
+
+# One of the page's queries, through the shared result cache
+def run_query(session, name, query):
+    return versioned_result(session.page, name, lambda: session.for_stage(name).sql(query).to_pandas(), ttl=600)
+
+
+# The channel's frames from the shared snapshot, see WarmStart
+@st.cache_resource
+def get_warm_start(channel):
+    background = GovernedSession(page_setup.snowflake_sessions(), f'{channel}_appointments', user='background')
+    goals_query = leaderboard.goals_query(channel)
+    appts_query = leaderboard.appts_query(channel)
+    return WarmStart(shared_backend(), f'{channel}_appointments', {
+        'goals': lambda: background.for_stage('refresh_goals').sql(goals_query).to_pandas(),
+        'appts': lambda: background.for_stage('refresh_appts').sql(appts_query).to_pandas(),
+    }, max_age=600)
+
+
+# Current goals and appointments. Sessions that just saved targets need fresh
+# data, so they bypass the snapshot.
+def load_frames(channel, session, data_version):
+    if data_version == 0:
+        frames = get_warm_start(channel).frames()
+        return frames['goals'], frames['appts']
+    return (run_query(session, 'goals', leaderboard.goals_query(channel)),
+            run_query(session, 'appts', leaderboard.appts_query(channel)))
+
+
+# Compute progress, colors, ordering and the market layout for every timeframe
+# at once, so switching the timeframe is just a lookup
+@st.cache_data(ttl=600, show_spinner=False)
+def get_leaderboards(df_goals, df_appts, channel):
+    leaderboards = leaderboard.build_leaderboards(df_goals, df_appts, channel)
+    return leaderboards, leaderboard.build_layouts(leaderboards, MARKET_COLUMNS, CARDS_PER_ROW)
+
+
+# Refreshes the weekly aggregate in the background at most once per TTL for the
+# whole process, whichever channel or number of weeks is asked for. The refresh
+# is a transaction, so it runs on a session of its own.
+@st.cache_resource(show_spinner=False)
+def get_trend_refresher():
+    import trends
+
+    secrets = st.secrets
+
+    def refresh():
+        trend_session = connection.create_snowflake_session(secrets)
+        try:
+            trends.refresh_weekly_aggregate(GovernedSession(trend_session, 'trends', 'refresh', 'background'))
+        finally:
+            trend_session.close()
+
+    return trends.AggregateRefresher(refresh, max_age=900)
+
+
+# Weekly counts come from the pre-aggregated table as compact arrays, read again
+# once a refresh lands (refreshed_at)
+@st.cache_data(ttl=900, show_spinner=False)
+def get_trend_arrays(channel, weeks, refreshed_at, _session):
+    import trends
+
+    df_weekly = trends.load_weekly(_session.for_stage('trend'), leaderboard.CHANNELS[channel]['sales_channel'], weeks)
+    return trends.build_trend_arrays(df_weekly, weeks)
+
+
+# Render the appointment leaderboard of one channel, see leaderboard.CHANNELS
+def render(channel):
+    # Statements of this page, tagged with the viewer
+    session = GovernedSession(page_setup.snowflake_sessions(), f'{channel}_appointments', user=page_setup.current_user())
+
+    # Ensure data_version exists
+    data_version = st.session_state.get('data_version', 0)
+
+    df_goals, df_appts = load_frames(channel, session, data_version)
+    leaderboards, layouts = get_leaderboards(df_goals, df_appts, channel)
+
+    # Sidebar filters with default values from query params
+    st.sidebar.title("Filters")
+
+    # Read query parameters
+    query_params = st.experimental_get_query_params()
+
+    # Get default filter values from query params
+    default_selected_group = query_params.get('selected_group', ['All Groups'])
+    default_selected_timeframe = query_params.get('selected_timeframe', ['This Week'])[0]
+
+    # Wall displays open the page with ?kiosk=1, optionally with &refresh=<seconds>,
+    # to have changed cards updated in place instead of reloading the whole page
+    kiosk_mode = query_params.get('kiosk', ['0'])[0] == '1'
+    refresh_param = query_params.get('refresh', ['60'])[0]
+    refresh_seconds = max(int(refresh_param), 10) if refresh_param.isdigit() else 60
+
+    selected_group = st.sidebar.multiselect(
+        'Group',
+        ['All Groups'] + leaderboard.market_groups(leaderboards),
+        default=default_selected_group,
+        key='group_multiselect'
+    )
+
+    selected_timeframe = st.sidebar.selectbox(
+        'Timeframe',
+        leaderboard.TIMEFRAMES,
+        index=leaderboard.TIMEFRAMES.index(default_selected_timeframe)
+    )
+
+    # Trend mode adds each closer's and market's weekly history to the cards
+    trend_mode = st.sidebar.toggle('Trend', value=False)
+    if trend_mode:
+        import trends
+
+        trend_weeks = st.sidebar.slider('Weeks', min_value=4, max_value=52, value=12)
+        refreshed_at = get_trend_refresher().check()
+        try:
+            trend_arrays = get_trend_arrays(channel, trend_weeks, refreshed_at, session)
+        except Exception:
+            if refreshed_at is not None:
+                raise
+            # A new deployment has no aggregate table until its first refresh lands
+            st.sidebar.info("Trend history is being prepared, try again in a minute.")
+            trend_mode = False
+
+    # Keep the filters, and the kiosk settings, in the URL
+    kiosk_params = {'kiosk': '1', 'refresh': str(refresh_seconds)} if kiosk_mode else {}
+    st.experimental_set_query_params(
+        selected_group=selected_group,
+        selected_timeframe=selected_timeframe,
+        **kiosk_params
+    )
+
+    # Apply filters to the precomputed layout
+    def visible_placement(layouts):
+        layout = layouts[selected_timeframe]
+        if 'All Groups' in selected_group:
+            return layout['placement']
+        blocks = [block for block in layout['blocks'] if block['group'] in selected_group]
+        return leaderboard.place_markets(blocks, MARKET_COLUMNS, CARDS_PER_ROW)
+
+    placement = visible_placement(layouts)
+
+    # Card markup, with the closer's weekly history in trend mode
+    def render_card(row):
+        sparkline = ''
+        if trend_mode:
+            sparkline = trends.sparkline_svg(
+                trends.closer_series(trend_arrays, row['CLOSER_ID']), row['GOAL'], row['PROGRESS_COLOR']
+            )
+        return leaderboard.card_html(row, sparkline)
+
+    # Placeholder of every card by leaderboard.card_key, so a card can be replaced alone
+    card_placeholders = {}
+
+    market_cols = st.columns(MARKET_COLUMNS)
+
+    # Walk each column's markets in rank order
+    for col, column_blocks in zip(market_cols, placement):
+        with col:
+            for block in column_blocks:
+                # Add a header for each market group
+                st.header(block['market'], help=block['notes'])
+
+                # Market total against the sum of its closers' goals
+                if trend_mode:
+                    market_series = trends.total_series(trend_arrays, [card['CLOSER_ID'] for card in block['cards']])
+                    market_goal = sum(card['GOAL'] for card in block['cards'])
+                    st.markdown(trends.sparkline_svg(market_series, market_goal, leaderboard.AT_GOAL_COLOR),
+                                unsafe_allow_html=True)
+
+                # Break the market into chunks (rows of cards)
+                for i in range(0, len(block['cards']), CARDS_PER_ROW):
+                    row_cards = block['cards'][i:i + CARDS_PER_ROW]  # Get a chunk of cards (one row)
+
+                    # Create columns for this row (inside each market column)
+                    cols = st.columns(CARDS_PER_ROW)
+
+                    # Loop through each card in the row and assign it to a column
+                    for col, row in zip(cols, row_cards):
+                        with col:
+                            placeholder = st.empty()
+                        placeholder.markdown(render_card(row), unsafe_allow_html=True)
+                        card_placeholders[leaderboard.card_key(row)] = placeholder
+
+    # Kiosk mode polls the cached leaderboard and replaces only the cards whose
+    # appointments or goal changed, so an idle refresh sends nothing. When closers
+    # are added, removed or moved the layout changes and the page reruns in full.
+    if kiosk_mode:
+        st.session_state['kiosk_card_values'] = leaderboard.card_values(placement)
+        refresh_status = st.empty()
+
+        @st.fragment(run_every=refresh_seconds)
+        def kiosk_refresh():
+            _, fresh_layouts = get_leaderboards(*load_frames(channel, session, data_version), channel)
+            fresh_placement = visible_placement(fresh_layouts)
+            if leaderboard.placement_signature(fresh_placement) != leaderboard.placement_signature(placement):
+                st.rerun()
+
+            changed = leaderboard.changed_cards(fresh_placement, st.session_state['kiosk_card_values'])
+            for row in changed:
+                card_placeholders[leaderboard.card_key(row)].markdown(render_card(row), unsafe_allow_html=True)
+            if changed:
+                st.session_state['kiosk_card_values'] = leaderboard.card_values(fresh_placement)
+                refresh_status.caption(f"Updated {len(changed)} card(s) at {time.strftime('%H:%M')}")
+
+        kiosk_refresh()
@@ -0,0 +1,437 @@
+"""Concurrent-viewer load test for the dashboard.
+
+Starts one `streamlit run streamlit_app.py` server on the offline data stand-in
+(offline_session.py), so no Snowflake connection is needed, and connects N
+simulated browsers to it over Streamlit's websocket protocol. Every viewer
+reruns its page in a loop, changing filters like a viewer would. Viewers of the
+Targets page also edit goals in the data editor and save them, and answer the
+save-status fragment's auto-reruns as a browser does.
+
+All sessions share the one server process, with its caches, save queue, session
+pool and GIL, as in production. Rerun latency therefore shows how many viewers
+one server handles before reruns queue up. Give several session counts to step
+the load, each on a fresh server:
+
+    python load_test.py --sessions 5 10 20 40 --duration 60
+    python load_test.py --sessions 50 --pages web fm --latency 0.2 --json results.json
+
+Reports reruns per second and p50/p95/p99 rerun latency per page, and the
+server's resident memory (Linux): idle, with one session, divided by the sessions,
+and added by each session after the first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# URL path of every page in the st.navigation menu, see sidebar.py; '' is the default page
+PAGES = {
+    'web': 'Web_Appointments',
+    'fm': 'FM_Appointments',
+    'targets': '',
+}
+
+# Seconds a single rerun may take before it counts as an error
+RERUN_TIMEOUT = 120
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+# Resident memory of a process in bytes, or None where /proc is not available
+def process_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    # One `streamlit run streamlit_app.py` process on the offline data
+
+    def __init__(self, args):
+        self.port = free_port()
+        env = dict(os.environ, OFFLINE_DATA='1', OFFLINE_LATENCY=str(args.latency))
+        env.setdefault('SNAPSHOT_DIR', os.path.join(ROOT, '.snapshots', 'load_test'))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', 'streamlit_app.py',
+             '--server.port', str(self.port), '--server.headless', 'true',
+             '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.url = f'ws://127.0.0.1:{self.port}/_stcore/stream'
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('streamlit exited during startup')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{self.port}/_stcore/health', timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('streamlit did not become healthy in time')
+
+    def rss(self):
+        return process_rss(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Viewer:
+    # One simulated browser session on one page. Like the frontend it sends the
+    # value of every widget it has seen with each rerun, and reruns fragments
+    # that ask for it with auto_rerun.
+
+    def __init__(self, url, page, rng, save_rate):
+        self.url = url
+        self.page = page
+        self.rng = rng
+        self.save_rate = save_rate
+        self.latencies = []
+        self.fragment_latencies = []
+        self.errors = 0
+        self.edits = 0
+        self.saves = 0
+
+        self._websocket = None
+        self._page_script_hash = ''
+        self._elements = {}        # widget id -> (element type, latest element proto)
+        self._widget_states = {}   # widget id -> WidgetState
+        self._fragments = {}       # fragment id -> task rerunning it on its interval
+        self._pending = None       # (sent at, future) of the rerun in flight
+        self._tasks = []
+
+    async def open(self):
+        from tornado.websocket import websocket_connect
+
+        self._websocket = await websocket_connect(self.url, max_message_size=64 * 2 ** 20)
+        self._tasks.append(asyncio.ensure_future(self._receive()))
+        await self.rerun()
+
+    def _stop_fragments(self):
+        for task in self._fragments.values():
+            task.cancel()
+        self._fragments = {}
+
+    def close(self):
+        self._stop_fragments()
+        for task in self._tasks:
+            task.cancel()
+        if self._websocket is not None:
+            self._websocket.close()
+
+    def _send(self, triggers=(), fragment_id=''):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = ''
+        # The first run picks the page by URL path, later runs by its script hash
+        if self._page_script_hash:
+            client_state.page_script_hash = self._page_script_hash
+        else:
+            client_state.page_name = PAGES[self.page]
+        if fragment_id:
+            client_state.fragment_id = fragment_id
+        for state in self._widget_states.values():
+            client_state.widget_states.widgets.append(state)
+        for widget_id in triggers:
+            client_state.widget_states.widgets.add(id=widget_id, trigger_value=True)
+        self._websocket.write_message(message.SerializeToString(), binary=True)
+
+    # Rerun the page, or one fragment, and wait for it to finish
+    async def rerun(self, triggers=(), fragment_id=''):
+        # A full run sends every widget and fragment again, with new ids where they changed
+        if not fragment_id:
+            self._stop_fragments()
+            self._elements = {}
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending = (time.perf_counter(), future)
+        self._send(triggers, fragment_id)
+        try:
+            elapsed = await asyncio.wait_for(future, RERUN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.errors += 1
+            return
+        finally:
+            # A full rerun may have replaced a fragment rerun still in flight
+            if self._pending is pending:
+                self._pending = None
+        (self.fragment_latencies if fragment_id else self.latencies).append(elapsed)
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            raw = await self._websocket.read_message()
+            if raw is None:
+                return
+            message = ForwardMsg()
+            message.ParseFromString(raw)
+            kind = message.WhichOneof('type')
+            if kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element = message.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type == 'exception':
+                    self.errors += 1
+                # Targets.py confirms every save it queues with a toast
+                elif element_type == 'toast' and element.toast.body.startswith('Saving changes'):
+                    self.saves += 1
+                elif element_type in ('selectbox', 'multiselect', 'checkbox', 'slider', 'arrow_data_frame', 'button'):
+                    widget = getattr(element, element_type)
+                    # Read-only dataframes have no widget id
+                    if widget.id:
+                        self._elements[widget.id] = (element_type, widget)
+            elif kind == 'navigation':
+                # Streamlit 1.37 also sends page_not_found on the first session of a
+                # process before st.navigation finds the page, so check the page run
+                navigation = message.navigation
+                running = next((page for page in navigation.app_pages
+                                if page.page_script_hash == navigation.page_script_hash), None)
+                expected = PAGES[self.page]
+                if running is None or not (running.url_pathname == expected or running.is_default and not expected):
+                    self.errors += 1
+                self._page_script_hash = navigation.page_script_hash
+            elif kind == 'auto_rerun':
+                fragment_id = message.auto_rerun.fragment_id
+                if fragment_id not in self._fragments:
+                    self._fragments[fragment_id] = asyncio.ensure_future(
+                        self._auto_rerun(fragment_id, message.auto_rerun.interval))
+            elif kind == 'script_finished':
+                status = message.script_finished
+                if self._pending is not None and status in (ForwardMsg.FINISHED_SUCCESSFULLY,
+                                                            ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY):
+                    sent_at, future = self._pending
+                    if status == ForwardMsg.FINISHED_SUCCESSFULLY:
+                        self._widget_states = {widget_id: state for widget_id, state in self._widget_states.items()
+                                               if widget_id in self._elements}
+                    if not future.done():
+                        future.set_result(time.perf_counter() - sent_at)
+
+    # Like the browser, skip a fragment tick while a rerun is still running
+    async def _auto_rerun(self, fragment_id, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if self._pending is None:
+                await self.rerun(fragment_id=fragment_id)
+
+    # The first widget of a type with this label, or whose user key ends its id
+    def _widget(self, element_type, label=None, key=None, form_id=None):
+        for widget_id, (kind, widget) in self._elements.items():
+            if kind != element_type:
+                continue
+            if label is not None and widget.label != label:
+                continue
+            if key is not None and not widget_id.endswith(f'-{key}'):
+                continue
+            if form_id is not None and widget.form_id != form_id:
+                continue
+            return widget
+        return None
+
+    def _set(self, widget_id, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        self._widget_states[widget_id] = WidgetState(id=widget_id, **value)
+
+    # Change one filter the way a viewer would, then rerun
+    async def step(self):
+        if self.page == 'targets':
+            if self.rng.random() < self.save_rate and await self.save():
+                return
+            market = self._widget('selectbox', key='market_select')
+            if market is not None:
+                self._set(market.id, int_value=self.rng.randrange(len(market.options)))
+            await self.rerun()
+            return
+
+        choice = self.rng.random()
+        timeframe = self._widget('selectbox', 'Timeframe')
+        groups = self._widget('multiselect', 'Group')
+        trend = self._widget('checkbox', 'Trend')
+        if choice < 0.6 and timeframe is not None:
+            self._set(timeframe.id, int_value=self.rng.randrange(len(timeframe.options)))
+        elif choice < 0.9 and groups is not None:
+            picked = self.rng.sample(range(1, len(groups.options)), k=min(len(groups.options) - 1, self.rng.randint(1, 2)))
+            self._set(groups.id, int_array_value={'data': picked or [0]})
+        elif trend is not None:
+            current = self._widget_states.get(trend.id)
+            self._set(trend.id, bool_value=not (current.bool_value if current is not None else trend.default))
+        await self.rerun()
+
+    # Edit one closer's goal in the targets editor and submit the form. The
+    # editor's widget id covers its data, so, as in a browser, the edit is dropped
+    # when a save flushed since the editor was drawn; those count as not saved.
+    async def save(self):
+        import pyarrow as pa
+
+        editor = self._widget('arrow_data_frame', form_id='editor_form')
+        submit = self._widget('button', form_id='editor_form')
+        if editor is None or submit is None:
+            return False
+        goals = pa.ipc.open_stream(editor.data).read_all().column('GOAL').to_pylist()
+        if not goals:
+            return False
+        row = self.rng.randrange(len(goals))
+        goal = self.rng.choice([value for value in range(5, 21) if value != goals[row]])
+        edits = {'edited_rows': {str(row): {'GOAL': goal}}, 'added_rows': [], 'deleted_rows': []}
+        self._set(editor.id, string_value=json.dumps(edits))
+        await self.rerun(triggers=[submit.id])
+        # The browser clears the editor's edits once the form is submitted
+        self._widget_states.pop(editor.id, None)
+        self.edits += 1
+        return True
+
+
+async def drive(server, args, sessions):
+    rng = random.Random(args.seed)
+    viewers = [Viewer(server.url, args.pages[i % len(args.pages)], random.Random(rng.random()), args.save_rate)
+               for i in range(sessions)]
+
+    # One session first, so imports and caches are loaded before the others join
+    memory = {'idle': server.rss()}
+    await viewers[0].open()
+    memory['one_session'] = server.rss()
+    await asyncio.gather(*(viewer.open() for viewer in viewers[1:]))
+    memory['all_sessions'] = server.rss()
+
+    peak = [memory['all_sessions'] or 0]
+
+    async def sample_memory():
+        while True:
+            peak[0] = max(peak[0], server.rss() or 0)
+            await asyncio.sleep(0.5)
+
+    async def interact(viewer, deadline):
+        while time.monotonic() < deadline:
+            await viewer.step()
+            await asyncio.sleep(viewer.rng.uniform(0, args.think_time))
+
+    sampler = asyncio.ensure_future(sample_memory())
+    started = time.monotonic()
+    await asyncio.gather(*(interact(viewer, started + args.duration) for viewer in viewers))
+    elapsed = time.monotonic() - started
+    sampler.cancel()
+    memory['peak'] = peak[0]
+    for viewer in viewers:
+        viewer.close()
+    return viewers, elapsed, memory
+
+
+def run_step(args, sessions):
+    server = Server(args)
+    try:
+        server.wait_ready()
+        viewers, elapsed, memory = asyncio.run(drive(server, args, sessions))
+    finally:
+        server.stop()
+
+    mb = 2 ** 20
+    per_session = None
+    if sessions > 1 and memory['all_sessions'] and memory['one_session']:
+        per_session = round((memory['all_sessions'] - memory['one_session']) / (sessions - 1) / mb, 2)
+    result = {
+        'sessions': sessions,
+        'duration_seconds': round(elapsed, 2),
+        'statement_latency_seconds': args.latency,
+        'server_rss_idle_mb': round(memory['idle'] / mb, 1) if memory['idle'] else None,
+        'server_rss_one_session_mb': round(memory['one_session'] / mb, 1) if memory['one_session'] else None,
+        'server_rss_peak_mb': round(memory['peak'] / mb, 1) if memory['peak'] else None,
+        'server_rss_per_session_mb': round(memory['all_sessions'] / sessions / mb, 2) if memory['all_sessions'] else None,
+        'memory_per_session_mb': per_session,
+        'edits_submitted': sum(viewer.edits for viewer in viewers),
+        'saves_queued': sum(viewer.saves for viewer in viewers),
+        'fragment_reruns': sum(len(viewer.fragment_latencies) for viewer in viewers),
+        'pages': {},
+    }
+    for page in args.pages:
+        page_viewers = [viewer for viewer in viewers if viewer.page == page]
+        # The first run of each session is the cold start, reported separately
+        cold = sorted(viewer.latencies[0] for viewer in page_viewers if viewer.latencies)
+        warm = sorted(latency for viewer in page_viewers for latency in viewer.latencies[1:])
+        result['pages'][page] = {
+            'sessions': len(page_viewers),
+            'reruns': len(warm),
+            'reruns_per_second': round(len(warm) / elapsed, 2),
+            'errors': sum(viewer.errors for viewer in page_viewers),
+            'first_run_p50_ms': round(percentile(cold, 50) * 1000, 1),
+            'p50_ms': round(percentile(warm, 50) * 1000, 1),
+            'p95_ms': round(percentile(warm, 95) * 1000, 1),
+            'p99_ms': round(percentile(warm, 99) * 1000, 1),
+        }
+    return result
+
+
+def print_report(result):
+    print(f"{result['sessions']} sessions on one server for {result['duration_seconds']}s "
+          f"(simulated statement latency {result['statement_latency_seconds']}s)")
+    print(f"{'page':<10}{'sessions':>9}{'reruns':>8}{'rerun/s':>9}{'errors':>8}"
+          f"{'first p50':>12}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for page, stats in result['pages'].items():
+        print(f"{page:<10}{stats['sessions']:>9}{stats['reruns']:>8}{stats['reruns_per_second']:>9}"
+              f"{stats['errors']:>8}{stats['first_run_p50_ms']:>10}ms{stats['p50_ms']:>8}ms"
+              f"{stats['p95_ms']:>8}ms{stats['p99_ms']:>8}ms")
+    print(f"server RSS: {result['server_rss_idle_mb']} MB idle, {result['server_rss_one_session_mb']} MB "
+          f"with one session, {result['server_rss_peak_mb']} MB peak, {result['server_rss_per_session_mb']} MB "
+          f"per session; {result['memory_per_session_mb']} MB per additional session; "
+          f"{result['saves_queued']} of {result['edits_submitted']} submitted edits saved, "
+          f"{result['fragment_reruns']} fragment reruns")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10],
+                        help='Concurrent viewer sessions; several values run one step each')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of concurrent interaction per step')
+    parser.add_argument('--pages', nargs='+', choices=sorted(PAGES), default=['web', 'fm', 'targets'])
+    parser.add_argument('--think-time', type=float, default=1.0, help='Maximum pause between interactions, seconds')
+    parser.add_argument('--save-rate', type=float, default=0.2, help='Chance a Targets interaction saves a goal')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated seconds per Snowflake statement')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for sessions in args.sessions:
+        result = run_step(args, sessions)
+        print_report(result)
+        results.append(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import leaderboard
+import statements
+import trends
+
+# Simulated warehouse time per statement, in seconds
+OFFLINE_LATENCY = float(os.environ.get('OFFLINE_LATENCY', '0'))
+
+FIRST_NAMES = ['Alex', 'Blake', 'Casey', 'Dana', 'Emery', 'Finley', 'Gray', 'Harper', 'Indy', 'Jordan',
+               'Kai', 'Logan', 'Morgan', 'Noel', 'Oakley', 'Parker', 'Quinn', 'Riley', 'Sage', 'Taylor']
+LAST_NAMES = ['Adams', 'Brooks', 'Carter', 'Diaz', 'Ellis', 'Foster', 'Garcia', 'Hayes', 'Irwin', 'Jensen']
+MARKETS = ['Phoenix', 'Tucson', 'Las Vegas', 'Denver', 'Salt Lake', 'Boise', 'Albuquerque', 'El Paso']
+MARKET_GROUPS = ['West', 'Mountain', 'Southwest']
+CLOSER_TYPES = ['🏠🏃 Hybrid', '🏃 Field Marketing', '🏠 Web To Home']
+
+
+def _normalize(query):
+    return ' '.join(query.split())
+
+
+class OfflineData:
+    # Generated tables shared by every OfflineSession in the process, so writes
+    # from one page are seen by the others just like in Snowflake
+
+    def __init__(self, seed=7, closers=120, weeks=52):
+        rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+        self.markets = pd.DataFrame({
+            'MARKET': MARKETS,
+            'MARKET_GROUP': [MARKET_GROUPS[i % len(MARKET_GROUPS)] for i in range(len(MARKETS))],
+            'RANK': np.arange(1, len(MARKETS) + 1),
+            'NOTES': [f'{market} office' if i % 2 == 0 else None for i, market in enumerate(MARKETS)],
+        })
+
+        names = [f'{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]}{"" if i < 200 else i}'
+                 for i in range(closers)]
+        ids = [f'005{i:015d}' for i in range(closers)]
+        self.users = pd.DataFrame({'FULL_NAME': names, 'SALESFORCE_ID': ids, 'PROFILE_PICTURE': None})
+
+        self.appointments = pd.DataFrame({
+            'CLOSER_ID': ids,
+            'NAME': names,
+            'GOAL': rng.integers(5, 20, closers),
+            'RANK': rng.integers(1, 30, closers),
+            'FM_GOAL': rng.integers(5, 20, closers),
+            'FM_RANK': rng.integers(1, 30, closers),
+            'ACTIVE': np.where(rng.random(closers) < 0.9, 'Yes', 'No'),
+            'TYPE': rng.choice(CLOSER_TYPES, closers),
+            'MARKET': rng.choice(MARKETS, closers),
+            'TIMESTAMP': datetime(2024, 9, 1).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'PROFILE_PICTURE': None,
+        })
+
+        opportunity_rows = []
+        for config in leaderboard.CHANNELS.values():
+            for timeframe in leaderboard.TIMEFRAMES:
+                opportunity_rows.append(pd.DataFrame({
+                    'CLOSER_ID': ids,
+                    'SALES_CHANNEL': config['sales_channel'],
+                    'TIMEFRAME': timeframe,
+                    'APPOINTMENTS': rng.poisson(8, closers),
+                }))
+        self.opportunity = pd.concat(opportunity_rows, ignore_index=True)
+
+        today = pd.Timestamp.today().normalize()
+        current_week = today - pd.Timedelta(days=today.weekday())
+        week_starts = pd.date_range(end=current_week, periods=weeks, freq='7D')
+        self.weekly = pd.DataFrame([
+            {'CLOSER_ID': closer_id, 'SALES_CHANNEL': config['sales_channel'], 'WEEK_START': week_start.date(),
+             'APPOINTMENTS': int(count)}
+            for config in leaderboard.CHANNELS.values()
+            for closer_id in ids
+            for week_start, count in zip(week_starts, rng.poisson(8, weeks))
+        ])
+
+
+_shared_data = None
+_shared_data_lock = threading.Lock()
+
+
+def shared_data():
+    global _shared_data
+    with _shared_data_lock:
+        if _shared_data is None:
+            _shared_data = OfflineData()
+        return _shared_data
+
+
+class OfflineResult:
+    # Records the statement parameters it is run with in its history entry
+
+    def __init__(self, df, entry):
+        self._df = df
+        self._entry = entry
+
+    def to_pandas(self, statement_params=None, **kwargs):
+        self._entry['statement_params'] = statement_params
+        return self._df.copy()
+
+    def collect(self, statement_params=None, **kwargs):
+        self._entry['statement_params'] = statement_params
+        return self._df.to_dict('records')
+
+
+class OfflineFileOperation:
+    def __init__(self, session):
+        self._session = session
+
+    def put(self, local_path, stage_location, statement_params=None, **kwargs):
+        self._session.history.append({'sql': f'PUT file://{local_path} {stage_location}', 'params': None,
+                                      'statement_params': statement_params})
+        return []
+
+
+class OfflineSession:
+    # Stand-in for a Snowpark session that answers the app's own queries from
+    # generated data and records every statement it is given in `history`,
+    # with its bind parameters and the statement parameters it ran with
+
+    def __init__(self, data=None, latency=OFFLINE_LATENCY):
+        self.data = data or shared_data()
+        self.latency = latency
+        self.history = []
+        self.file = OfflineFileOperation(self)
+
+        self._handlers = {
+            _normalize(statements.MERGE_TARGETS): self._merge_targets,
+            _normalize(statements.READ_TARGETS): self._read_targets,
+            _normalize(statements.MERGE_MARKETS): self._merge_markets,
+            _normalize(statements.DELETE_MARKETS): self._delete_markets,
+            _normalize(trends.REFRESH_WINDOW_QUERY): self._refresh_window,
+            _normalize(trends.WEEKLY_TREND_QUERY): self._weekly_trend,
+        }
+        for channel in leaderboard.CHANNELS:
+            self._handlers[_normalize(leaderboard.goals_query(channel))] = lambda params, channel=channel: self._goals(channel)
+            self._handlers[_normalize(leaderboard.appts_query(channel))] = lambda params, channel=channel: self._appts(channel)
+
+    def sql(self, query, params=None):
+        entry = {'sql': query, 'params': params, 'statement_params': None}
+        self.history.append(entry)
+        if self.latency:
+            time.sleep(self.latency)
+        normalized = _normalize(query)
+        with self.data.lock:
+            handler = self._handlers.get(normalized)
+            if handler is not None:
+                return OfflineResult(handler(params), entry)
+            return OfflineResult(self._match(normalized), entry)
+
+    def close(self):
+        pass
+
+    # Queries that are not shared constants, recognized by what they read
+    def _match(self, query):
+        upper = query.upper()
+        if 'FROM OPERATIONAL.AIRTABLE.VW_USERS' in upper:
+            if 'SALESFORCE_ID' in upper:
+                return self.data.users[['FULL_NAME', 'SALESFORCE_ID']].copy()
+            return self.data.users[['FULL_NAME', 'PROFILE_PICTURE']].copy()
+        if upper.startswith('SELECT') and 'FROM RAW.SNOWFLAKE.LM_MARKETS' in upper:
+            return self.data.markets.copy()
+        if upper.startswith('SELECT * FROM RAW.SNOWFLAKE.LM_APPOINTMENTS'):
+            return self.data.appointments.copy()
+        # DDL, transactions, staging and the bulk import only change state we don't model
+        return pd.DataFrame({'status': ['Statement executed successfully.']})
+
+    def _goals(self, channel):
+        config = leaderboard.CHANNELS[channel]
+        appointments = self.data.appointments
+        active = appointments[(appointments['ACTIVE'] == 'Yes') & appointments['TYPE'].isin(config['types'])]
+        markets = self.data.markets.rename(columns={'RANK': 'MARKET_RANK'})
+        df = active.merge(markets, on='MARKET', how='left')
+        name_parts = df['NAME'].str.split(' ')
+        df['NAME'] = name_parts.str[0] + ' ' + name_parts.str[1].str[:1] + '.'
+        df = df[['MARKET_GROUP', 'MARKET_RANK', 'NOTES', config['goal_column'], 'MARKET', 'TYPE',
+                 config['rank_column'], 'ACTIVE', 'CLOSER_ID', 'PROFILE_PICTURE', 'NAME']]
+        return df.merge(pd.DataFrame({'TIMEFRAME': leaderboard.TIMEFRAMES}), how='cross')
+
+    def _appts(self, channel):
+        config = leaderboard.CHANNELS[channel]
+        opportunity = self.data.opportunity
+        df = opportunity[opportunity['SALES_CHANNEL'] == config['sales_channel']]
+        return df[['CLOSER_ID', 'APPOINTMENTS', 'TIMEFRAME']].copy()
+
+    def _merge_targets(self, params):
+        appointments = self.data.appointments
+        for row in json.loads(params[0]):
+            matches = appointments.index[appointments['NAME'] == row['NAME']]
+            values = {column: row[column] for column in
+                      ['GOAL', 'RANK', 'FM_GOAL', 'FM_RANK', 'ACTIVE', 'TYPE', 'MARKET', 'PROFILE_PICTURE']}
+            values['TIMESTAMP'] = row['WRITE_TIMESTAMP']
+            if len(matches):
+                current = appointments.at[matches[0], 'TIMESTAMP']
+                if current == row['EXPECTED_TIMESTAMP'] or (pd.isna(current) and row['EXPECTED_TIMESTAMP'] is None):
+                    for column, value in values.items():
+                        appointments.loc[matches, column] = value
+            elif row['EXPECTED_TIMESTAMP'] is None:
+                appointments.loc[len(appointments)] = {**values, 'CLOSER_ID': row['CLOSER_ID'], 'NAME': row['NAME']}
+        return pd.DataFrame({'number of rows inserted': [0], 'number of rows updated': [0]})
+
+    def _read_targets(self, params):
+        names = json.loads(params[0])
+        appointments = self.data.appointments
+        return appointments.loc[appointments['NAME'].isin(names),
+                                ['NAME', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK', 'ACTIVE', 'TYPE', 'MARKET', 'TIMESTAMP']]
+
+    def _merge_markets(self, params):
+        markets = self.data.markets
+        for row in json.loads(params[0]):
+            values = {'MARKET_GROUP': row['MARKET_GROUP'], 'RANK': row['RANK'], 'NOTES': row['NOTES']}
+            matches = markets.index[markets['MARKET'] == row['MARKET']]
+            if len(matches):
+                for column, value in values.items():
+                    markets.loc[matches, column] = value
+            else:
+                markets.loc[len(markets)] = {**values, 'MARKET': row['MARKET']}
+        return pd.DataFrame({'number of rows inserted': [0], 'number of rows updated': [0]})
+
+    def _delete_markets(self, params):
+        deleted = json.loads(params[0])
+        self.data.markets = self.data.markets[~self.data.markets['MARKET'].isin(deleted)].reset_index(drop=True)
+        return pd.DataFrame({'number of rows deleted': [len(deleted)]})
+
+    def _refresh_window(self, params):
+        today = pd.Timestamp.today().normalize()
+        return pd.DataFrame({'WINDOW_START': [(today - pd.Timedelta(days=today.weekday() + 14)).date()]})
+
+    def _weekly_trend(self, params):
+        sales_channel, weeks = params
+        today = pd.Timestamp.today().normalize()
+        current_week = (today - pd.Timedelta(days=today.weekday())).date()
+        first_week = (pd.Timestamp(current_week) - pd.Timedelta(weeks=weeks)).date()
+        weekly = self.data.weekly
+        selected = (weekly['SALES_CHANNEL'] == sales_channel) & (weekly['WEEK_START'] > first_week) \
+            & (weekly['WEEK_START'] <= current_week)
+        return weekly.loc[selected, ['CLOSER_ID', 'WEEK_START', 'APPOINTMENTS']]
@@ -0,0 +1,64 @@
+import streamlit as st
+
+import connection
+import leaderboard
+from query_governor import pool_size
+
+# Styles of every page, injected in a single block by the entry point
+APP_CSS = """
+    <style>
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    .css-10trblm {padding-top: 0px; padding-bottom: 0px;}
+    .css-1d391kg {padding-top: 0px !important; margin-bottom: 0 !important;}
+    .css-18e3th9 {padding-top: 0 !important;}
+    header.st-emotion-cache-1qv137k.eczjsme2 {
+        padding-top: 20px;  /* Adjust this for more top padding */
+        font-size: 18px;  /* Adjust the size of the header text */
+    }
+    """ + leaderboard.CARD_CSS + """
+    </style>
+"""
+
+
+# Set by configure_app, so pages can tell they were reached through streamlit_app.py
+ENTRY_POINT_KEY = 'app_configured'
+
+
+# Page config, logo and styles shared by every page; streamlit_app.py calls this
+# once per run, before the selected page
+def configure_app():
+    st.session_state[ENTRY_POINT_KEY] = True
+    st.set_page_config(
+        page_title="Appointment Dashboard",
+        layout="wide",
+        initial_sidebar_state="collapsed"
+    )
+    st.logo("https://i.ibb.co/bbH9pgH/Purelight-Logo.webp")
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+
+
+# Stop a page started on its own, e.g. by a deployment that still runs
+# `streamlit run Targets.py`, which would otherwise lose the page config, styles
+# and navigation without any error
+def require_entry_point():
+    if not st.session_state.get(ENTRY_POINT_KEY):
+        st.error("This app now starts from streamlit_app.py. Run `streamlit run streamlit_app.py` instead.")
+        st.stop()
+
+
+# Snowflake sessions of this server process, shared by every page and viewer.
+# Snowpark sessions of the pinned version are not thread-safe, so the pool lends
+# each one to a single statement at a time and replaces sessions that expired.
+# It holds enough sessions for every statement the pages may run at once.
+@st.cache_resource(show_spinner=False)
+def snowflake_sessions():
+    secrets = st.secrets
+    return connection.SessionPool(lambda: connection.create_snowflake_session(secrets),
+                                  max_sessions=pool_size('targets', 'web_appointments', 'fm_appointments'))
+
+
+# The signed-in viewer, for query tags
+def current_user():
+    return st.experimental_user.get('email') or 'anonymous'
@@ -0,0 +1,133 @@
+import json
+import re
+import threading
+
+from connection import SessionPool, checkout, session_expired
+
+# Application name in every query tag, so warehouse cost can be broken down by app
+APP_NAME = 'appointment-dashboard'
+
+# Per page: seconds a statement may run before Snowflake cancels it, and how many
+# statements the page may have running at once in this server process
+PAGE_POLICIES = {
+    'targets': {'statement_timeout': 300, 'max_concurrent': 4},
+    'web_appointments': {'statement_timeout': 60, 'max_concurrent': 6},
+    'fm_appointments': {'statement_timeout': 60, 'max_concurrent': 6},
+    'leaderboard_export': {'statement_timeout': 60, 'max_concurrent': 2},
+    'trends': {'statement_timeout': 300, 'max_concurrent': 1},
+}
+
+# Functions evaluated at execution time. A read that calls one never matches an
+# earlier result in Snowflake's result cache; CURRENT_DATE is exempt from that rule.
+VOLATILE_FUNCTIONS = re.compile(
+    r'\b(CURRENT_TIMESTAMP|CURRENT_TIME|LOCALTIMESTAMP|SYSDATE|GETDATE|UUID_STRING|RANDOM)\b', re.IGNORECASE
+)
+
+
+# Sessions a connection.SessionPool needs for the given pages to run all the
+# statements their policies allow at once
+def pool_size(*pages):
+    return sum(PAGE_POLICIES[page]['max_concurrent'] for page in pages)
+
+
+def query_tag(page, stage, user):
+    return json.dumps({'app': APP_NAME, 'page': page, 'stage': stage, 'user': user}, sort_keys=True)
+
+
+# Reads must keep a stable text so repeats are answered from the result cache;
+# volatile values belong in bind parameters or in Python
+def check_stable(query):
+    if query.lstrip().upper().startswith(('SELECT', 'WITH')) and VOLATILE_FUNCTIONS.search(query):
+        raise ValueError(f"Query calls {VOLATILE_FUNCTIONS.search(query).group(0)}, which defeats the result cache")
+
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+# Concurrency slots of one page, shared by all of its sessions in the process
+def page_slots(page):
+    with _slots_lock:
+        if page not in _slots:
+            _slots[page] = threading.BoundedSemaphore(PAGE_POLICIES[page]['max_concurrent'])
+        return _slots[page]
+
+
+class GovernedSession:
+    # Wraps a Snowpark session, or a connection.SessionPool, for one page. Every
+    # statement is tagged with the page, stage and user, runs under the page's
+    # statement timeout and waits for one of the page's concurrency slots. Tag and
+    # timeout travel with each statement as statement parameters, so a session
+    # never needs an ALTER SESSION round trip before it is lent to another stage.
+    # Pooled statements that fail on an expired session run once more on a new one.
+
+    def __init__(self, session, page, stage='page', user='anonymous'):
+        self.session = session
+        self.page = page
+        self.stage = stage
+        self.user = user
+        self.policy = PAGE_POLICIES[page]
+        self.file = GovernedFileOperation(self)
+
+    # The same session or pool, tagged with another stage and optionally another user
+    def for_stage(self, stage, user=None):
+        return GovernedSession(self.session, self.page, stage, user or self.user)
+
+    def statement_params(self):
+        return {
+            'QUERY_TAG': query_tag(self.page, self.stage, self.user),
+            'STATEMENT_TIMEOUT_IN_SECONDS': self.policy['statement_timeout'],
+        }
+
+    def sql(self, query, params=None):
+        check_stable(query)
+        return GovernedQuery(self, query, params)
+
+    # Call execute(session, statement_params) once one of the page's slots is free
+    def run(self, execute):
+        slots = page_slots(self.page)
+        if not slots.acquire(timeout=self.policy['statement_timeout']):
+            raise TimeoutError(f"Too many queries running for {self.page}, try again shortly")
+        try:
+            try:
+                return self._execute(execute)
+            except Exception as e:
+                if not (isinstance(self.session, SessionPool) and session_expired(e)):
+                    raise
+                # The pool dropped the expired session; the retry logs in again
+                return self._execute(execute)
+        finally:
+            slots.release()
+
+    def _execute(self, execute):
+        with checkout(self.session) as session:
+            return execute(session, self.statement_params())
+
+    def close(self):
+        self.session.close()
+
+
+class GovernedQuery:
+    # A statement that has not run yet; it runs governed on to_pandas or collect
+
+    def __init__(self, governed, query, params):
+        self._governed = governed
+        self._query = query
+        self._params = params
+
+    def to_pandas(self, **kwargs):
+        return self._governed.run(lambda session, statement_params: session.sql(
+            self._query, params=self._params).to_pandas(statement_params=statement_params, **kwargs))
+
+    def collect(self, **kwargs):
+        return self._governed.run(lambda session, statement_params: session.sql(
+            self._query, params=self._params).collect(statement_params=statement_params, **kwargs))
+
+
+class GovernedFileOperation:
+    def __init__(self, governed):
+        self._governed = governed
+
+    def put(self, local_file_name, stage_location, **kwargs):
+        return self._governed.run(lambda session, statement_params: session.file.put(
+            local_file_name, stage_location, statement_params=statement_params, **kwargs))
@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cache_backend import shared_backend
+
+# Byte budget shared by every page in the server process
+RESULT_CACHE_MB = float(os.environ.get('RESULT_CACHE_MB', '256'))
+
+# Longest a miss waits for another session's load of the same key before querying itself
+LOAD_WAIT_SECONDS = 120
+
+
+# Memory held by a cached value; frames are measured with their object columns
+# (strings) included, containers by what they hold
+def value_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        size = value.memory_usage(deep=True)
+        return int(size.sum()) if isinstance(size, pd.Series) else int(size)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(k) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(value_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    # Query results kept in memory up to a byte budget, least recently used first out.
+    #
+    # Keys are tuples whose first item is a namespace (e.g. 'targets'), so all
+    # results of a page can be invalidated together after a write. Concurrent
+    # misses for the same key wait for a single load instead of each querying.
+    # Cached frames are shared between sessions and must not be modified in place.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (value, size, loaded_at)
+        self._loading = {}              # key -> event set when the load finishes
+        self._bytes = 0
+        # Bumped by invalidate, so loads that started before it are not stored
+        self._epoch = 0
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'oversized': 0}
+
+    # Return the cached value for `key`, calling `loader` on a miss. Entries older
+    # than `ttl` seconds count as misses.
+    def get_or_load(self, key, loader, ttl=None):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and (ttl is None or time.time() - entry[2] < ttl):
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    epoch = self._epoch
+                    self._stats['misses'] += 1
+                    break
+                self._stats['coalesced'] += 1
+            # Another session is loading this key; use its result once it lands,
+            # or load ourselves if it failed or was not stored. A load that takes
+            # too long is left to finish, and this session queries on its own.
+            if not loading.wait(LOAD_WAIT_SECONDS):
+                with self._lock:
+                    self._stats['misses'] += 1
+                return loader()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+
+        # Release the waiters however the load ends, including interrupts and
+        # Streamlit's rerun and stop exceptions, which are not Exceptions
+        try:
+            value = loader()
+            size = value_size(value)
+            with self._lock:
+                if epoch == self._epoch:
+                    self._store(key, value, size)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return value
+
+    def _store(self, key, value, size):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        if size > self.max_bytes:
+            self._stats['oversized'] += 1
+            return
+        self._entries[key] = (value, size, time.time())
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats['evictions'] += 1
+
+    # Drop every entry of the given namespaces, e.g. after saving targets
+    def invalidate(self, *namespaces):
+        with self._lock:
+            self._epoch += 1
+            for key in [key for key in self._entries if key[0] in namespaces]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses'] + self._stats['coalesced']
+            return {
+                **self._stats,
+                'hit_rate': (self._stats['hits'] + self._stats['coalesced']) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+# The process-wide cache every page shares, so the budget covers all of them
+def shared_cache():
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache(int(RESULT_CACHE_MB * 2 ** 20))
+        return _shared_cache
+
+
+# Load a query result through the shared cache, keyed by the namespace's shared
+# data version (see cache_backend). Every session reading the same data shares
+# one entry, and saves in other replicas move readers on to a new one.
+def versioned_result(namespace, name, loader, ttl=None):
+    return shared_cache().get_or_load((namespace, name, shared_backend().version(namespace)), loader, ttl=ttl)
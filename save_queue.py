@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import statements
+
+logger = logging.getLogger(__name__)
+
+# Statuses reported back to the page that queued a save
+QUEUED = 'queued'
+SAVED = 'saved'
+CONFLICT = 'conflict'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+
+
+# Format a row version (the TIMESTAMP column) so it compares the same way on every load
+def format_version(value):
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return str(value)
+
+
+# Identical submissions (same owner, row, values and base version) share a key,
+# so a double-clicked save or a replayed rerun is only written once
+def make_idempotency_key(owner, kind, key, values, expected_version):
+    payload = json.dumps([owner, kind, key, values, expected_version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# Write all queued closer targets in one MERGE, guarded by the version each row was read at,
+# then read back only those closers to tell saved rows from conflicts
+def flush_targets(session, entries):
+    batch = []
+    for entry in entries:
+        values = entry['values']
+        batch.append({
+            'CLOSER_ID': values['SALESFORCE_ID'],
+            'NAME': entry['key'],
+            'GOAL': int(values['GOAL']),
+            'RANK': int(values['RANK']),
+            'FM_GOAL': int(values['FM_GOAL']),
+            'FM_RANK': int(values['FM_RANK']),
+            'ACTIVE': values['ACTIVE'],
+            'TYPE': values['TYPE'],
+            'MARKET': values['MARKET'],
+            'PROFILE_PICTURE': values['PROFILE_PICTURE'],
+            'EXPECTED_TIMESTAMP': entry['expected_version'],
+            'WRITE_TIMESTAMP': entry['write_version'],
+        })
+    statements.execute_write(session, statements.MERGE_TARGETS, batch)
+
+    current_rows = statements.execute(session, statements.READ_TARGETS, [entry['key'] for entry in entries]).to_pandas()
+    current_rows['TIMESTAMP'] = current_rows['TIMESTAMP'].map(format_version)
+    current_rows = current_rows.drop_duplicates(subset='NAME', keep='last').set_index('NAME')
+
+    results = {}
+    for entry in entries:
+        if entry['key'] not in current_rows.index:
+            results[entry['idempotency_key']] = (CONFLICT, None)
+            continue
+        current = current_rows.loc[entry['key']].to_dict()
+        # A retry of a write that already landed also reads back our own version
+        if current['TIMESTAMP'] == entry['write_version']:
+            results[entry['idempotency_key']] = (SAVED, None)
+        else:
+            results[entry['idempotency_key']] = (CONFLICT, current)
+    return results
+
+
+# Apply queued market upserts with one MERGE and deletes with one DELETE
+def flush_markets(session, entries):
+    upserts = [
+        {
+            'MARKET': entry['key'],
+            'MARKET_GROUP': entry['values']['MARKET_GROUP'],
+            'RANK': entry['values']['RANK'],
+            'NOTES': entry['values']['NOTES'],
+            'TIMESTAMP': entry['write_version'],
+        }
+        for entry in entries if entry['values']['ACTION'] == 'upsert'
+    ]
+    deletes = [entry['key'] for entry in entries if entry['values']['ACTION'] == 'delete']
+
+    if upserts:
+        statements.execute_write(session, statements.MERGE_MARKETS, upserts)
+    if deletes:
+        statements.execute_write(session, statements.DELETE_MARKETS, deletes)
+
+    return {entry['idempotency_key']: (SAVED, None) for entry in entries}
+
+
+# Entries with the same pending key coalesce in the queue
+def pending_key(entry):
+    return (entry['kind'], entry['key'], entry['owner'], entry['expected_version'])
+
+
+class SaveQueue:
+    # Queue of pending writes drained by a background thread.
+    #
+    # Pages enqueue one entry per changed closer or market and return immediately.
+    # Entries of one owner for the same (kind, key) and base version coalesce so only
+    # the last write is sent. Writes from different owners, or from different base
+    # versions, stay separate and reach the row one batch after another, so the
+    # MERGE guard reports the later one as a conflict instead of it being dropped.
+    # Due entries are flushed together by the flusher registered for their kind,
+    # and failed batches are retried with exponential backoff on a new session.
+    # After a batch writes rows, on_saved(kind, entries) is called with the saved
+    # entries before their owners can see them as saved, e.g. to invalidate caches.
+    # Finished statuses nobody collects, e.g. of closed tabs, expire after `status_ttl` seconds.
+
+    def __init__(self, session_factory, flushers, on_saved=None, flush_interval=1.0, max_attempts=5,
+                 retry_backoff=1.0, max_backoff=30.0, status_ttl=3600):
+        self._session_factory = session_factory
+        self._session = None
+        self._flushers = flushers
+        self._on_saved = on_saved
+        self._flush_interval = flush_interval
+        self._max_attempts = max_attempts
+        self._retry_backoff = retry_backoff
+        self._max_backoff = max_backoff
+        self._status_ttl = status_ttl
+
+        self._condition = threading.Condition()
+        self._pending = {}   # (kind, key, owner, expected version) -> entry
+        self._sequence = 0   # enqueue order, so writes to one row are flushed in turn
+        self._status = {}    # idempotency key -> status record
+        self._written = {}   # (kind, key) -> (owner, base version, written version)
+
+        self._thread = threading.Thread(target=self._run, name='save-queue', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, owner, kind, key, values, expected_version=None):
+        idempotency_key = make_idempotency_key(owner, kind, key, values, expected_version)
+        with self._condition:
+            known = self._status.get(idempotency_key)
+            if known is not None and known['status'] != FAILED:
+                return idempotency_key
+
+            # The owner's editor still holds the version their previous save replaced
+            written = self._written.get((kind, key))
+            if written is not None and written[0] == owner and written[1] == expected_version:
+                expected_version = written[2]
+
+            # The owner's last write from the same base version wins
+            pending_key = (kind, key, owner, expected_version)
+            previous = self._pending.get(pending_key)
+            if previous is not None:
+                self._finish(previous, SUPERSEDED)
+
+            self._sequence += 1
+            self._pending[pending_key] = {
+                'idempotency_key': idempotency_key,
+                'owner': owner,
+                'kind': kind,
+                'key': key,
+                'values': values,
+                'expected_version': expected_version,
+                'write_version': None,
+                'attempts': 0,
+                'sequence': previous['sequence'] if previous is not None else self._sequence,
+                'due_at': time.monotonic() + self._flush_interval,
+            }
+            self._status[idempotency_key] = {
+                'status': QUEUED, 'owner': owner, 'kind': kind, 'key': key,
+                'values': values, 'current': None, 'message': '', 'version': None, 'finished_at': None,
+            }
+            self._condition.notify()
+        return idempotency_key
+
+    # Number of writes from this owner that have not been flushed yet
+    def pending_count(self, owner):
+        with self._condition:
+            return sum(1 for entry in self._pending.values() if entry['owner'] == owner)
+
+    # Return and forget the finished writes for this owner
+    def collect(self, owner):
+        with self._condition:
+            finished = {
+                idempotency_key: record for idempotency_key, record in self._status.items()
+                if record['owner'] == owner and record['status'] != QUEUED
+            }
+            for idempotency_key in finished:
+                del self._status[idempotency_key]
+        return list(finished.values())
+
+    def _finish(self, entry, status, current=None, message=''):
+        record = self._status.get(entry['idempotency_key'])
+        if record is not None:
+            record.update(status=status, current=current, message=message,
+                          version=entry['write_version'], finished_at=time.monotonic())
+
+    def _expire_status(self):
+        expired_before = time.monotonic() - self._status_ttl
+        for idempotency_key in [idempotency_key for idempotency_key, record in self._status.items()
+                                if record['finished_at'] is not None and record['finished_at'] < expired_before]:
+            del self._status[idempotency_key]
+
+    def _take_due(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                # At most one write per row and batch, oldest first, as a MERGE
+                # cannot update the same row from two source rows
+                due = {}
+                for entry in sorted(self._pending.values(), key=lambda entry: entry['sequence']):
+                    if entry['due_at'] <= now:
+                        due.setdefault((entry['kind'], entry['key']), entry)
+                if due:
+                    for entry in due.values():
+                        del self._pending[pending_key(entry)]
+                    return list(due.values())
+                wait = min((entry['due_at'] for entry in self._pending.values()), default=now + 60) - now
+                self._condition.wait(timeout=max(wait, 0.05))
+
+    def _run(self):
+        while True:
+            due = self._take_due()
+            by_kind = {}
+            for entry in due:
+                by_kind.setdefault(entry['kind'], []).append(entry)
+            for kind, entries in by_kind.items():
+                self._flush(kind, entries)
+
+    def _flush(self, kind, entries):
+        # Each entry keeps its write version across retries so a retried batch is idempotent
+        write_version = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        for entry in entries:
+            entry['write_version'] = entry['write_version'] or write_version
+            entry['attempts'] += 1
+
+        try:
+            if self._session is None:
+                self._session = self._session_factory()
+            results = self._flushers[kind](self._session, entries)
+        except Exception as e:
+            # The connection may have dropped or expired; retry on a new one
+            self._reset_session()
+            self._retry(entries, str(e))
+            return
+
+        saved = [entry for entry in entries if results[entry['idempotency_key']][0] == SAVED]
+        if saved and self._on_saved is not None:
+            try:
+                self._on_saved(kind, saved)
+            except Exception:
+                logger.exception("on_saved failed for %d %s write(s)", len(saved), kind)
+
+        with self._condition:
+            for entry in entries:
+                status, current = results[entry['idempotency_key']]
+                if status == SAVED:
+                    self._written[(kind, entry['key'])] = (
+                        entry['owner'], entry['expected_version'], entry['write_version']
+                    )
+                self._finish(entry, status, current=current)
+            self._expire_status()
+
+    def _reset_session(self):
+        session, self._session = self._session, None
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def _retry(self, entries, message):
+        with self._condition:
+            for entry in entries:
+                if entry['attempts'] >= self._max_attempts:
+                    self._finish(entry, FAILED, message=message)
+                    continue
+                # A newer write of the same owner and base version already replaced this one
+                if pending_key(entry) in self._pending:
+                    self._finish(entry, SUPERSEDED)
+                    continue
+                delay = min(self._retry_backoff * 2 ** (entry['attempts'] - 1), self._max_backoff)
+                entry['due_at'] = time.monotonic() + delay
+                self._pending[pending_key(entry)] = entry
+            self._condition.notify()
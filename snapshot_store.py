@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+# Snapshots live next to the app unless SNAPSHOT_DIR points somewhere else
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.snapshots'))
+
+
+class SnapshotStore:
+    # Last good query results for one page, kept on disk as uncompressed Feather files.
+    #
+    # Each save writes a new generation directory and then atomically replaces
+    # manifest.json, so readers never see a half-written snapshot. Only the newest
+    # `keep` generations are retained. Directories the manifest does not list,
+    # left by writers that died before replacing it, are removed once they are
+    # `orphan_age` seconds old; younger ones may still be written by another process.
+
+    def __init__(self, namespace, directory=SNAPSHOT_DIR, keep=3, orphan_age=600):
+        self.directory = os.path.join(directory, namespace)
+        self.keep = keep
+        self.orphan_age = orphan_age
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, 'manifest.json')
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'generations': []}
+
+    # Write the frames as a new generation; `version` records which shared data
+    # version (see cache_backend) they were read at
+    def save(self, frames, version=0):
+        generation = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        generation_dir = os.path.join(self.directory, generation)
+        os.makedirs(generation_dir, exist_ok=True)
+
+        entry = {'generation': generation, 'created_at': time.time(), 'version': version, 'frames': {}}
+        for name, df in frames.items():
+            file_name = f'{name}.feather'
+            # Uncompressed so the file can be memory-mapped on load
+            feather.write_feather(df.reset_index(drop=True), os.path.join(generation_dir, file_name),
+                                  compression='uncompressed')
+            entry['frames'][name] = {'file': file_name, 'rows': len(df)}
+
+        manifest = self.read_manifest()
+        manifest['generations'] = [entry] + manifest['generations']
+        retired = manifest['generations'][self.keep:]
+        manifest['generations'] = manifest['generations'][:self.keep]
+
+        # Unique per writer, as several processes may save the same namespace
+        temp_path = f'{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+        for old in retired:
+            shutil.rmtree(os.path.join(self.directory, old['generation']), ignore_errors=True)
+        self._remove_orphans({entry['generation'] for entry in manifest['generations']})
+
+    def _remove_orphans(self, listed):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name in listed or not os.path.isdir(path):
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) < self.orphan_age:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    # Return (frames, manifest entry) of the newest readable generation, or
+    # (None, None) if there is none
+    def load_entry(self):
+        for entry in self.read_manifest()['generations']:
+            generation_dir = os.path.join(self.directory, entry['generation'])
+            try:
+                frames = {
+                    name: feather.read_table(os.path.join(generation_dir, info['file']), memory_map=True).to_pandas()
+                    for name, info in entry['frames'].items()
+                }
+            except OSError:
+                continue
+            # Snapshots written before versions were recorded count as version 0
+            return frames, {**entry, 'version': entry.get('version', 0)}
+        return None, None
+
+    # Return the frames of the newest readable generation, or None if there is none
+    def load(self):
+        return self.load_entry()[0]
+
+
+class WarmStart:
+    # Serves a page's frames from the shared snapshot (see cache_backend) right
+    # after a restart and refreshes them from Snowflake in a background thread.
+    #
+    # Frames older than `max_age` seconds, or read before the namespace's shared
+    # data version was last bumped, keep being served while a refresh runs, so
+    # only the very first load without any snapshot blocks the page. Refreshes
+    # hold the backend's lock for the namespace and first look for a snapshot
+    # another replica just wrote, so one process per namespace queries Snowflake.
+
+    def __init__(self, backend, namespace, loaders, max_age=600):
+        self._backend = backend
+        self._namespace = namespace
+        self._loaders = loaders
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._frames = None
+        self._loaded_at = None
+        self._version = None
+        self._refreshing = False
+        # Bumped whenever the served frames are replaced, so callers can cache derived data
+        self.generation = 0
+
+        frames, info = self._read_snapshot()
+        if frames is not None:
+            self._use(frames, info)
+
+    # With block_if_stale, stale frames are refreshed before returning instead of
+    # in the background, for callers that exit before a background refresh lands
+    def frames(self, block_if_stale=False):
+        if self._frames is None:
+            self._refresh()
+        elif self._stale(self._loaded_at, self._version, self._backend.version(self._namespace)):
+            if block_if_stale:
+                self._refresh()
+            else:
+                self._start_refresh()
+        return self._frames
+
+    def _stale(self, loaded_at, version, current_version):
+        return loaded_at is None or time.time() - loaded_at > self._max_age or version != current_version
+
+    def _read_snapshot(self):
+        try:
+            frames, info = self._backend.load_frames(self._namespace)
+        except Exception:
+            logger.exception("Could not read the %s snapshot", self._namespace)
+            return None, None
+        if frames is None or not set(self._loaders) <= set(frames):
+            return None, None
+        return frames, info
+
+    def _use(self, frames, info):
+        self._frames = frames
+        self._loaded_at = info['created_at']
+        self._version = info['version']
+        self.generation += 1
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name='snapshot-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception:
+            # Keep serving the last good frames; the next page view retries
+            logger.exception("Snapshot refresh failed for %s", self._namespace)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh(self):
+        with self._load_lock:
+            # Another thread may have finished loading while we waited
+            version = self._backend.version(self._namespace)
+            if self._frames is not None and not self._stale(self._loaded_at, self._version, version):
+                return
+            # If another replica holds the lock past the timeout, query anyway
+            with self._backend.lock(f'refresh-{self._namespace}'):
+                # The version may have moved while we waited for the lock
+                version = self._backend.version(self._namespace)
+                frames, info = self._read_snapshot()
+                if frames is None or self._stale(info['created_at'], info['version'], version):
+                    # Read the version before querying, so a save landing during
+                    # the queries leaves these frames stale rather than hiding it
+                    frames = {name: loader() for name, loader in self._loaders.items()}
+                    info = {'created_at': time.time(), 'version': version}
+                    try:
+                        self._backend.save_frames(self._namespace, frames, version)
+                    except Exception:
+                        logger.exception("Could not share the %s snapshot", self._namespace)
+            self._use(frames, info)
@@ -0,0 +1,117 @@
+import json
+
+# Fixed write statements shared by every page.
+#
+# Each statement takes its whole batch as a single JSON bind variable that is
+# expanded server-side with FLATTEN, so the SQL text never changes with the data
+# or the batch size. Snowflake can reuse the compiled plan, one batch is one
+# round trip, and values are never spliced into the SQL text.
+
+BATCH_SOURCE = "TABLE(FLATTEN(input => PARSE_JSON(?)))"
+
+MERGE_TARGETS = f"""
+    MERGE INTO raw.snowflake.lm_appointments AS target
+    USING (
+        SELECT
+            value:CLOSER_ID::string AS CLOSER_ID,
+            value:NAME::string AS NAME,
+            value:GOAL::integer AS GOAL,
+            value:RANK::integer AS RANK,
+            value:FM_GOAL::integer AS FM_GOAL,
+            value:FM_RANK::integer AS FM_RANK,
+            value:ACTIVE::string AS ACTIVE,
+            value:TYPE::string AS TYPE,
+            value:MARKET::string AS MARKET,
+            value:PROFILE_PICTURE::string AS PROFILE_PICTURE,
+            value:EXPECTED_TIMESTAMP::string AS EXPECTED_TIMESTAMP,
+            value:WRITE_TIMESTAMP::string AS WRITE_TIMESTAMP
+        FROM {BATCH_SOURCE}
+    ) AS source
+    ON target.NAME = source.NAME
+    WHEN MATCHED AND EQUAL_NULL(target.TIMESTAMP, source.EXPECTED_TIMESTAMP) THEN
+        UPDATE SET
+            GOAL = source.GOAL,
+            RANK = source.RANK,
+            FM_GOAL = source.FM_GOAL,
+            FM_RANK = source.FM_RANK,
+            ACTIVE = source.ACTIVE,
+            TYPE = source.TYPE,
+            MARKET = source.MARKET,
+            TIMESTAMP = source.WRITE_TIMESTAMP,
+            PROFILE_PICTURE = source.PROFILE_PICTURE
+    WHEN NOT MATCHED AND source.EXPECTED_TIMESTAMP IS NULL THEN
+        INSERT (CLOSER_ID, NAME, GOAL, RANK, FM_GOAL, FM_RANK, ACTIVE, TYPE, MARKET, TIMESTAMP, PROFILE_PICTURE)
+        VALUES (source.CLOSER_ID, source.NAME, source.GOAL, source.RANK, source.FM_GOAL, source.FM_RANK,
+            source.ACTIVE, source.TYPE, source.MARKET, source.WRITE_TIMESTAMP, source.PROFILE_PICTURE)
+"""
+
+READ_TARGETS = f"""
+    SELECT NAME, GOAL, RANK, FM_GOAL, FM_RANK, ACTIVE, TYPE, MARKET, TIMESTAMP
+    FROM raw.snowflake.lm_appointments
+    WHERE NAME IN (SELECT value::string FROM {BATCH_SOURCE})
+"""
+
+MERGE_MARKETS = f"""
+    MERGE INTO raw.snowflake.lm_markets AS target
+    USING (
+        SELECT
+            value:MARKET::string AS MARKET,
+            value:MARKET_GROUP::string AS MARKET_GROUP,
+            value:RANK::integer AS RANK,
+            value:NOTES::string AS NOTES,
+            value:TIMESTAMP::string AS TIMESTAMP
+        FROM {BATCH_SOURCE}
+    ) AS source
+    ON target.MARKET = source.MARKET
+    WHEN MATCHED THEN
+        UPDATE SET MARKET_GROUP = source.MARKET_GROUP, RANK = source.RANK,
+            NOTES = source.NOTES, TIMESTAMP = source.TIMESTAMP
+    WHEN NOT MATCHED THEN
+        INSERT (MARKET, MARKET_GROUP, RANK, NOTES, TIMESTAMP)
+        VALUES (source.MARKET, source.MARKET_GROUP, source.RANK, source.NOTES, source.TIMESTAMP)
+"""
+
+DELETE_MARKETS = f"""
+    DELETE FROM raw.snowflake.lm_markets
+    WHERE MARKET IN (SELECT value::string FROM {BATCH_SOURCE})
+"""
+
+
+# Temporary table a bulk targets upload is copied into, see target_import.py
+IMPORT_TABLE = 'targets_import'
+
+# Apply an uploaded targets file; the last row for a closer wins and blank cells
+# keep the current value. Both parameters are the import's row version.
+MERGE_IMPORTED_TARGETS = f"""
+    MERGE INTO raw.snowflake.lm_appointments AS target
+    USING (
+        SELECT * FROM {IMPORT_TABLE}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY NAME ORDER BY FILE_ROW DESC) = 1
+    ) AS source
+    ON target.NAME = source.NAME
+    WHEN MATCHED THEN
+        UPDATE SET
+            GOAL = COALESCE(source.GOAL, target.GOAL),
+            RANK = COALESCE(source.RANK, target.RANK),
+            FM_GOAL = COALESCE(source.FM_GOAL, target.FM_GOAL),
+            FM_RANK = COALESCE(source.FM_RANK, target.FM_RANK),
+            ACTIVE = COALESCE(source.ACTIVE, target.ACTIVE),
+            TYPE = COALESCE(source.TYPE, target.TYPE),
+            MARKET = COALESCE(source.MARKET, target.MARKET),
+            TIMESTAMP = ?
+    WHEN NOT MATCHED THEN
+        INSERT (CLOSER_ID, NAME, GOAL, RANK, FM_GOAL, FM_RANK, ACTIVE, TYPE, MARKET, TIMESTAMP)
+        VALUES (source.SALESFORCE_ID, source.NAME, COALESCE(source.GOAL, 0), COALESCE(source.RANK, 100),
+            COALESCE(source.FM_GOAL, 0), COALESCE(source.FM_RANK, 100), COALESCE(source.ACTIVE, 'No'),
+            COALESCE(source.TYPE, '🏠🏃 Hybrid'), COALESCE(source.MARKET, 'No Market'), ?)
+"""
+
+
+# Run a fixed statement with its batch bound as one JSON parameter
+def execute(session, statement, batch):
+    return session.sql(statement, params=[json.dumps(batch, default=str)])
+
+
+# Run a write statement and wait for it
+def execute_write(session, statement, batch):
+    return execute(session, statement, batch).collect()
@@ -0,0 +1,7 @@
+import page_setup
+from sidebar import sidebar
+
+# App entry point: `streamlit run streamlit_app.py`.
+# Shared setup happens here once per run; the selected page then only renders.
+page_setup.configure_app()
+sidebar()
@@ -0,0 +1,144 @@
+import csv
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+import statements
+
+# Columns of the staged file, in the order they are written and copied
+STAGED_COLUMNS = ['FILE_ROW', 'SALESFORCE_ID', 'NAME', 'MARKET', 'TYPE', 'ACTIVE', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK']
+
+# Target columns an upload may set; blank cells keep the current value
+TARGET_COLUMNS = ['MARKET', 'TYPE', 'ACTIVE', 'GOAL', 'RANK', 'FM_GOAL', 'FM_RANK']
+NUMBER_COLUMNS = ['GOAL', 'RANK', 'FM_GOAL', 'FM_RANK']
+
+ACTIVE_VALUES = {'yes': 'Yes', 'true': 'Yes', '1': 'Yes', 'no': 'No', 'false': 'No', '0': 'No'}
+
+STAGE_NAME = 'targets_import_stage'
+TABLE_NAME = statements.IMPORT_TABLE
+
+
+# Yield the uploaded file as DataFrames of at most chunk_size rows, all as text
+def read_chunks(uploaded_file, chunk_size=5000):
+    if uploaded_file.name.lower().endswith(('.xlsx', '.xlsm')):
+        yield from _read_excel_chunks(uploaded_file, chunk_size)
+    else:
+        yield from pd.read_csv(uploaded_file, dtype=str, chunksize=chunk_size, skipinitialspace=True)
+
+
+def _read_excel_chunks(uploaded_file, chunk_size):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Excel uploads need the openpyxl package; upload a CSV file instead.")
+
+    # Read-only mode streams rows instead of loading the whole workbook
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [str(value).strip() if value is not None else '' for value in next(rows, [])]
+    chunk = []
+    for row in rows:
+        chunk.append(['' if value is None else str(value) for value in row])
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame(chunk, columns=header)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=header)
+    workbook.close()
+
+
+# Validate one chunk against the users, markets and channel types.
+# Returns the rows ready for staging and a frame of rejected rows with a reason.
+def validate_chunk(chunk, first_row_number, users_by_name, valid_markets, valid_types):
+    # users_by_name maps a lower-cased full name to its (FULL_NAME, SALESFORCE_ID)
+    chunk = chunk.rename(columns=lambda column: str(column).strip().upper().replace(' ', '_'))
+    chunk = chunk.rename(columns={'FULL_NAME': 'NAME'})
+    if 'NAME' not in chunk.columns:
+        raise ValueError("The file needs a NAME (or FULL_NAME) column.")
+    if not any(column in chunk.columns for column in TARGET_COLUMNS):
+        raise ValueError(f"The file needs at least one of these columns: {', '.join(TARGET_COLUMNS)}.")
+
+    df = pd.DataFrame({'FILE_ROW': range(first_row_number, first_row_number + len(chunk))})
+    for column in ['NAME'] + TARGET_COLUMNS:
+        values = chunk[column] if column in chunk.columns else pd.Series('', index=chunk.index)
+        df[column] = values.fillna('').astype(str).str.strip().to_numpy()
+
+    errors = pd.Series('', index=df.index)
+
+    # Resolve names to Salesforce ids, using the spelling from the users table
+    user = df['NAME'].str.lower().map(users_by_name)
+    errors = errors.mask(user.isna() & (errors == ''), 'Unknown closer name')
+    df['NAME'] = user.str[0].fillna(df['NAME'])
+    df['SALESFORCE_ID'] = user.str[1]
+
+    market_set = df['MARKET'] != ''
+    errors = errors.mask(market_set & ~df['MARKET'].isin(valid_markets) & (errors == ''), 'Unknown market')
+
+    type_set = df['TYPE'] != ''
+    errors = errors.mask(type_set & ~df['TYPE'].isin(valid_types) & (errors == ''), 'Unknown type')
+
+    active = df['ACTIVE'].str.lower().map(ACTIVE_VALUES)
+    errors = errors.mask((df['ACTIVE'] != '') & active.isna() & (errors == ''), 'ACTIVE must be Yes or No')
+    df['ACTIVE'] = active
+
+    for column in NUMBER_COLUMNS:
+        numbers = pd.to_numeric(df[column].where(df[column] != ''), errors='coerce')
+        bad = (df[column] != '') & (numbers.isna() | (numbers % 1 != 0))
+        errors = errors.mask(bad & (errors == ''), f'{column} must be a whole number')
+        df[column] = numbers.where(~bad).astype('Int64')
+
+    df = df.replace({'MARKET': {'': None}, 'TYPE': {'': None}})
+    rejected = df.loc[errors != '', ['FILE_ROW', 'NAME']].assign(REASON=errors[errors != ''])
+    return df.loc[errors == '', STAGED_COLUMNS], rejected
+
+
+# Stream the upload through validation into one CSV file on local disk.
+# Returns the local path, the number of valid rows and all rejected rows.
+def stage_locally(uploaded_file, users, valid_markets, valid_types, chunk_size=5000):
+    users_by_name = {
+        full_name.strip().lower(): (full_name, salesforce_id)
+        for full_name, salesforce_id in zip(users['FULL_NAME'], users['SALESFORCE_ID'])
+    }
+    handle, path = tempfile.mkstemp(prefix='targets_import_', suffix='.csv')
+    valid_count = 0
+    rejected = []
+    with os.fdopen(handle, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(STAGED_COLUMNS)
+        # Row numbers match the spreadsheet, counting the header as row 1
+        first_row_number = 2
+        for chunk in read_chunks(uploaded_file, chunk_size):
+            valid, chunk_rejected = validate_chunk(chunk, first_row_number, users_by_name, valid_markets, valid_types)
+            valid.to_csv(f, header=False, index=False)
+            valid_count += len(valid)
+            rejected.append(chunk_rejected)
+            first_row_number += len(chunk)
+    rejected = pd.concat(rejected, ignore_index=True) if rejected else pd.DataFrame(columns=['FILE_ROW', 'NAME', 'REASON'])
+    return path, valid_count, rejected
+
+
+# Upload the staged file, copy it into a temporary table and apply it with a single MERGE
+def apply_import(session, local_path):
+    session.sql(f"CREATE TEMPORARY STAGE IF NOT EXISTS {STAGE_NAME}").collect()
+    session.sql(f"""
+        CREATE OR REPLACE TEMPORARY TABLE {TABLE_NAME} (
+            FILE_ROW INTEGER, SALESFORCE_ID VARCHAR, NAME VARCHAR, MARKET VARCHAR, TYPE VARCHAR,
+            ACTIVE VARCHAR, GOAL INTEGER, RANK INTEGER, FM_GOAL INTEGER, FM_RANK INTEGER
+        )
+    """).collect()
+
+    session.file.put(local_path, f'@{STAGE_NAME}', auto_compress=True, overwrite=True)
+    file_name = os.path.basename(local_path) + '.gz'
+    session.sql(f"""
+        COPY INTO {TABLE_NAME}
+        FROM @{STAGE_NAME}/{file_name}
+        FILE_FORMAT = (TYPE = CSV SKIP_HEADER = 1 FIELD_OPTIONALLY_ENCLOSED_BY = '"' EMPTY_FIELD_AS_NULL = TRUE)
+        PURGE = TRUE
+    """).collect()
+
+    # The last row for a closer wins; blank cells keep the current value
+    import_version = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    result = session.sql(statements.MERGE_IMPORTED_TARGETS, params=[import_version, import_version]).collect()
+    return result
@@ -0,0 +1,119 @@
+import pandas as pd
+
+import leaderboard
+from leaderboard import AT_GOAL_COLOR, BELOW_GOAL_COLOR, TIMEFRAMES
+from offline_session import OfflineSession
+
+
+# Goals rows as goals_query returns them for the web channel, one per timeframe
+def goals_frame(closers):
+    rows = []
+    for closer_id, market, market_rank, rank, goal in closers:
+        for timeframe in TIMEFRAMES:
+            rows.append({
+                'MARKET_GROUP': 'West' if market != 'Dallas' else 'Central', 'MARKET_RANK': market_rank,
+                'NOTES': f'{market} office', 'GOAL': goal, 'MARKET': market, 'TYPE': '🏠 Web To Home',
+                'RANK': rank, 'ACTIVE': 'Yes', 'CLOSER_ID': closer_id, 'PROFILE_PICTURE': None,
+                'NAME': closer_id.title(), 'TIMEFRAME': timeframe,
+            })
+    return pd.DataFrame(rows)
+
+
+def appts_frame(counts):
+    return pd.DataFrame([(closer_id, appointments, timeframe) for (closer_id, timeframe), appointments in counts.items()],
+                        columns=['CLOSER_ID', 'APPOINTMENTS', 'TIMEFRAME'])
+
+
+def test_rows_are_ordered_by_market_rank_then_closer_rank():
+    df_goals = goals_frame([
+        ('cara', 'Dallas', 2, 1, 10),
+        ('ann', 'Phoenix', 1, 5, 10),
+        ('bob', 'Phoenix', 1, 2, 10),
+    ])
+    leaderboards = leaderboard.build_leaderboards(df_goals, appts_frame({('ann', 'This Week'): 30}), 'web')
+
+    assert set(leaderboards) == set(TIMEFRAMES)
+    this_week = leaderboards['This Week']
+    assert list(this_week['CLOSER_ID']) == ['bob', 'ann', 'cara']
+    # Counts are not part of the order
+    assert list(this_week['APPOINTMENTS']) == [0, 30, 0]
+
+
+def test_progress_is_capped_and_zero_goals_count_as_met():
+    df_goals = goals_frame([
+        ('ann', 'Phoenix', 1, 1, 10),
+        ('bob', 'Phoenix', 1, 2, 0),
+        ('cara', 'Phoenix', 1, 3, 4),
+    ])
+    df_appts = appts_frame({('ann', 'This Week'): 5, ('cara', 'This Week'): 9})
+
+    this_week = leaderboard.build_leaderboards(df_goals, df_appts, 'web')['This Week'].set_index('CLOSER_ID')
+
+    assert this_week.loc['ann', 'PERCENTAGE_TO_GOAL'] == 50.0
+    assert this_week.loc['bob', 'PERCENTAGE_TO_GOAL'] == 100.0
+    assert this_week.loc['cara', 'PERCENTAGE_TO_GOAL'] == 100.0
+    assert list(this_week['PROGRESS_COLOR']) == [BELOW_GOAL_COLOR, AT_GOAL_COLOR, AT_GOAL_COLOR]
+
+
+def test_fm_channel_reads_its_own_goal_and_rank_columns():
+    df_goals = goals_frame([('ann', 'Phoenix', 1, 1, 10), ('bob', 'Phoenix', 1, 2, 10)])
+    df_goals = df_goals.rename(columns={'GOAL': 'FM_GOAL', 'RANK': 'FM_RANK'})
+    df_goals['FM_RANK'] = df_goals['CLOSER_ID'].map({'ann': 9, 'bob': 1})
+
+    this_week = leaderboard.build_leaderboards(df_goals, appts_frame({}), 'fm')['This Week']
+
+    assert list(this_week['CLOSER_ID']) == ['bob', 'ann']
+    assert list(this_week['GOAL']) == [10, 10]
+
+
+def test_market_blocks_keep_rank_order():
+    df_goals = goals_frame([
+        ('cara', 'Dallas', 2, 1, 10),
+        ('ann', 'Phoenix', 1, 5, 10),
+        ('bob', 'Phoenix', 1, 2, 10),
+    ])
+    leaderboards = leaderboard.build_leaderboards(df_goals, appts_frame({}), 'web')
+
+    blocks = leaderboard.build_market_blocks(leaderboards['Last Week'])
+
+    assert [block['market'] for block in blocks] == ['Phoenix', 'Dallas']
+    assert [block['group'] for block in blocks] == ['West', 'Central']
+    assert blocks[0]['notes'] == 'Phoenix office'
+    assert [card['CLOSER_ID'] for card in blocks[0]['cards']] == ['bob', 'ann']
+
+
+def test_timeframe_without_closers_has_no_blocks():
+    df_goals = goals_frame([('ann', 'Phoenix', 1, 1, 10)])
+    df_goals = df_goals[df_goals['TIMEFRAME'] != 'Next Week']
+
+    leaderboards = leaderboard.build_leaderboards(df_goals, appts_frame({}), 'web')
+
+    assert leaderboards['Next Week'].empty
+    assert leaderboard.build_market_blocks(leaderboards['Next Week']) == []
+    assert leaderboard.place_markets([], columns=2) == [[], []]
+
+
+def test_markets_go_to_the_shortest_column():
+    blocks = [{'market': market, 'cards': [{}] * cards} for market, cards in
+              [('A', 7), ('B', 2), ('C', 1), ('D', 3)]]
+
+    placement = leaderboard.place_markets(blocks, columns=2, cards_per_row=3)
+
+    # A is 1 + 3 rows high; B (2) and C (2) then fill the second column until it catches up
+    assert [[block['market'] for block in column] for column in placement] == [['A', 'D'], ['B', 'C']]
+
+
+def test_layouts_cover_every_timeframe_of_offline_data():
+    session = OfflineSession(latency=0)
+    df_goals = session.sql(leaderboard.goals_query('web')).to_pandas()
+    df_appts = session.sql(leaderboard.appts_query('web')).to_pandas()
+
+    leaderboards = leaderboard.build_leaderboards(df_goals, df_appts, 'web')
+    layouts = leaderboard.build_layouts(leaderboards, columns=2, cards_per_row=3)
+
+    for timeframe in TIMEFRAMES:
+        placed = [card['CLOSER_ID'] for column in layouts[timeframe]['placement']
+                  for block in column for card in block['cards']]
+        assert sorted(placed) == sorted(leaderboards[timeframe]['CLOSER_ID'])
+        ranks = [block['cards'][0]['MARKET_RANK'] for block in layouts[timeframe]['blocks']]
+        assert ranks == sorted(ranks)
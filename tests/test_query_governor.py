@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+
+import pytest
+
+import leaderboard
+import query_governor
+import trends
+from connection import SessionPool
+from offline_session import OfflineSession
+from query_governor import GovernedSession, check_stable, page_slots
+
+
+def test_statements_carry_tag_and_timeout():
+    session = OfflineSession(latency=0)
+    governed = GovernedSession(session, 'web_appointments', user='viewer@example.com')
+
+    governed.for_stage('goals').sql(leaderboard.goals_query('web')).to_pandas()
+    governed.for_stage('appts').sql(leaderboard.appts_query('web')).collect()
+
+    assert len(session.history) == 2
+    for entry, stage in zip(session.history, ['goals', 'appts']):
+        params = entry['statement_params']
+        assert params['STATEMENT_TIMEOUT_IN_SECONDS'] == 60
+        assert json.loads(params['QUERY_TAG']) == {
+            'app': query_governor.APP_NAME, 'page': 'web_appointments', 'stage': stage, 'user': 'viewer@example.com',
+        }
+
+
+def test_file_put_carries_statement_params():
+    session = OfflineSession(latency=0)
+    GovernedSession(session, 'targets', 'import', 'manager').file.put('/tmp/targets.csv.gz', '@stage')
+
+    assert json.loads(session.history[0]['statement_params']['QUERY_TAG'])['stage'] == 'import'
+    assert session.history[0]['statement_params']['STATEMENT_TIMEOUT_IN_SECONDS'] == 300
+
+
+@pytest.mark.parametrize('query', [
+    "SELECT CURRENT_TIMESTAMP() AS NOW",
+    "select * from t where updated_at > sysdate()",
+    "WITH x AS (SELECT RANDOM() r) SELECT r FROM x",
+])
+def test_volatile_reads_are_rejected(query):
+    with pytest.raises(ValueError):
+        check_stable(query)
+
+    session = OfflineSession(latency=0)
+    with pytest.raises(ValueError):
+        GovernedSession(session, 'targets').sql(query)
+    assert session.history == []
+
+
+def test_writes_and_current_date_are_allowed():
+    check_stable("INSERT INTO t SELECT CURRENT_TIMESTAMP()")
+    check_stable("SELECT * FROM t WHERE d = CURRENT_DATE()")
+
+
+def test_page_queries_are_stable():
+    session = OfflineSession(latency=0)
+    governed = GovernedSession(session, 'web_appointments')
+    for channel in leaderboard.CHANNELS:
+        governed.sql(leaderboard.goals_query(channel)).to_pandas()
+        governed.sql(leaderboard.appts_query(channel)).to_pandas()
+    governed.sql(trends.WEEKLY_TREND_QUERY, params=['Web To Home', 12]).to_pandas()
+
+    assert len(session.history) == 2 * len(leaderboard.CHANNELS) + 1
+    for entry in session.history:
+        assert 'CURRENT_TIMESTAMP' not in entry['sql'].upper()
+
+
+class CountingSession(OfflineSession):
+    # Records how many statements run at the same time
+
+    def __init__(self):
+        super().__init__(latency=0.05)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def sql(self, query, params=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            return super().sql(query, params)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def test_page(monkeypatch):
+    monkeypatch.setitem(query_governor.PAGE_POLICIES, 'test_page', {'statement_timeout': 1, 'max_concurrent': 2})
+    yield 'test_page'
+    query_governor._slots.pop('test_page', None)
+
+
+def test_page_slots_limit_concurrency(test_page):
+    session = CountingSession()
+    governed = GovernedSession(session, test_page)
+    threads = [threading.Thread(target=lambda: governed.sql(leaderboard.goals_query('fm')).to_pandas())
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(session.history) == 6
+    assert session.peak == 2
+
+
+def test_page_slots_time_out(test_page):
+    slots = page_slots(test_page)
+    slots.acquire()
+    slots.acquire()
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            GovernedSession(OfflineSession(latency=0), test_page).sql("SELECT 1").to_pandas()
+        assert time.monotonic() - started >= 1
+    finally:
+        slots.release()
+        slots.release()
+
+
+class ExpiredSessionError(Exception):
+    errno = 390114
+
+
+def test_pooled_statement_retries_on_expired_session():
+    sessions = []
+
+    def factory():
+        session = OfflineSession(latency=0)
+        if not sessions:
+            def expired(query, params=None):
+                raise ExpiredSessionError("Authentication token has expired")
+            session.sql = expired
+        sessions.append(session)
+        return session
+
+    governed = GovernedSession(SessionPool(factory), 'targets')
+    governed.sql(leaderboard.goals_query('web')).to_pandas()
+
+    assert len(sessions) == 2
+    assert len(sessions[1].history) == 1
+
+
+def test_pool_reuses_sessions_and_waits_at_its_cap():
+    sessions = []
+
+    def factory():
+        sessions.append(OfflineSession(latency=0.2))
+        return sessions[-1]
+
+    pool = SessionPool(factory, max_sessions=2)
+    governed = GovernedSession(pool, 'web_appointments')
+    threads = [threading.Thread(target=lambda: governed.sql(leaderboard.goals_query('web')).to_pandas())
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sessions) == 2
+    assert sum(len(session.history) for session in sessions) == 5
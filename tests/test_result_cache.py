@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import result_cache
+from result_cache import ResultCache, value_size
+
+
+def names_frame(rows, length=100):
+    return pd.DataFrame({'NAME': ['x' * length + str(i) for i in range(rows)], 'GOAL': range(rows)})
+
+
+def test_frames_are_sized_with_their_strings():
+    df = names_frame(100)
+
+    assert value_size(df) == int(df.memory_usage(deep=True).sum())
+    assert value_size(df) > int(df.memory_usage(deep=False).sum()) + 100 * 100
+    assert value_size({'goals': df, 'appts': df}) > 2 * value_size(df)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    df = names_frame(100)
+    cache = ResultCache(max_bytes=int(value_size(df) * 2.5))
+
+    cache.get_or_load(('page', 'a'), lambda: df)
+    cache.get_or_load(('page', 'b'), lambda: df.copy())
+    cache.get_or_load(('page', 'a'), lambda: pytest.fail("a should be cached"))
+    cache.get_or_load(('page', 'c'), lambda: df.copy())
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['bytes'] <= cache.max_bytes
+    # b was the least recently used when c arrived
+    cache.get_or_load(('page', 'a'), lambda: pytest.fail("a should be cached"))
+    cache.get_or_load(('page', 'c'), lambda: pytest.fail("c should be cached"))
+    loads = []
+    cache.get_or_load(('page', 'b'), lambda: loads.append('b') or df)
+    assert loads == ['b']
+
+
+def test_oversized_results_are_returned_but_not_kept():
+    df = names_frame(100)
+    cache = ResultCache(max_bytes=value_size(df) // 2)
+
+    assert cache.get_or_load(('page', 'a'), lambda: df) is df
+    assert cache.stats()['oversized'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ResultCache(max_bytes=2 ** 20)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return names_frame(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(('page', 'a'), loader)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['coalesced'] == 4
+
+
+def test_waiters_load_themselves_after_a_failed_load():
+    cache = ResultCache(max_bytes=2 ** 20)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("warehouse unavailable")
+
+    errors = []
+
+    def first_viewer():
+        try:
+            cache.get_or_load(('page', 'a'), failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first_viewer)
+    thread.start()
+    started.wait()
+    assert cache.get_or_load(('page', 'a'), lambda: 42) == 42
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_interrupted_load_does_not_block_later_lookups():
+    cache = ResultCache(max_bytes=2 ** 20)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        cache.get_or_load(('page', 'a'), interrupted)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(cache.get_or_load(('page', 'a'), lambda: 42)),
+                              daemon=True)
+    thread.start()
+    thread.join(2)
+    assert results == [42]
+
+
+def test_waiter_queries_itself_when_a_load_hangs(monkeypatch):
+    monkeypatch.setattr(result_cache, 'LOAD_WAIT_SECONDS', 0.1)
+    cache = ResultCache(max_bytes=2 ** 20)
+    release = threading.Event()
+    thread = threading.Thread(target=cache.get_or_load, args=(('page', 'a'), lambda: release.wait() and 1),
+                              daemon=True)
+    thread.start()
+    time.sleep(0.05)
+
+    assert cache.get_or_load(('page', 'a'), lambda: 2) == 2
+    release.set()
+    thread.join()
+
+
+def test_invalidate_drops_namespace_and_loads_in_flight():
+    cache = ResultCache(max_bytes=2 ** 20)
+    cache.get_or_load(('targets', 'users'), lambda: 'old users')
+    cache.get_or_load(('web_appointments', 'goals'), lambda: 'goals')
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow_load():
+        started.set()
+        release.wait()
+        return 'read before the save'
+
+    thread = threading.Thread(target=cache.get_or_load, args=(('targets', 'markets'), slow_load))
+    thread.start()
+    started.wait()
+    cache.invalidate('targets')
+    release.set()
+    thread.join()
+
+    # The load that started before the invalidation is not stored
+    assert cache.get_or_load(('targets', 'markets'), lambda: 'fresh markets') == 'fresh markets'
+    assert cache.get_or_load(('targets', 'users'), lambda: 'new users') == 'new users'
+    assert cache.get_or_load(('web_appointments', 'goals'), lambda: pytest.fail("other namespaces stay")) == 'goals'
+
+
+def test_expired_entries_count_as_misses():
+    cache = ResultCache(max_bytes=2 ** 20)
+    cache.get_or_load(('page', 'a'), lambda: 1, ttl=0.05)
+    time.sleep(0.1)
+
+    assert cache.get_or_load(('page', 'a'), lambda: 2, ttl=0.05) == 2
@@ -0,0 +1,175 @@
+import threading
+import time
+
+from save_queue import CONFLICT, FAILED, SAVED, SUPERSEDED, SaveQueue
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTable:
+    # Rows by key with their version, written under the same guard as the MERGE:
+    # a write lands only if the row is still at the version it was read at
+
+    def __init__(self, versions=None, failures=0):
+        self.versions = dict(versions or {})
+        self.values = {}
+        self.batches = []
+        self.failures = failures
+        self.sessions = []
+        self._lock = threading.Lock()
+
+    def session_factory(self):
+        self.sessions.append(FakeSession())
+        return self.sessions[-1]
+
+    def flush(self, session, entries):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("connection dropped")
+            self.batches.append([entry['key'] for entry in entries])
+            results = {}
+            for entry in entries:
+                if self.versions.get(entry['key']) == entry['expected_version']:
+                    self.versions[entry['key']] = entry['write_version']
+                    self.values[entry['key']] = entry['values']
+                    results[entry['idempotency_key']] = (SAVED, None)
+                else:
+                    results[entry['idempotency_key']] = (CONFLICT, {'TIMESTAMP': self.versions.get(entry['key'])})
+            return results
+
+
+def make_queue(table, **kwargs):
+    kwargs.setdefault('flush_interval', 0.05)
+    return SaveQueue(table.session_factory, {'target': table.flush}, **kwargs)
+
+
+# Collect finished statuses of an owner until `count` arrived
+def wait_for(queue, owner, count, timeout=5):
+    finished = []
+    deadline = time.monotonic() + timeout
+    while len(finished) < count and time.monotonic() < deadline:
+        finished += queue.collect(owner)
+        time.sleep(0.01)
+    assert len(finished) == count, finished
+    return finished
+
+
+def test_same_owner_and_base_version_coalesce():
+    table = FakeTable({'Ann': 'v1'})
+    queue = make_queue(table, flush_interval=0.2)
+
+    for goal in (5, 6, 7):
+        queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': goal}, 'v1')
+
+    statuses = sorted(record['status'] for record in wait_for(queue, 'manager-a', 3))
+    assert statuses == [SAVED, SUPERSEDED, SUPERSEDED]
+    assert table.batches == [['Ann']]
+    assert table.values['Ann'] == {'GOAL': 7}
+
+
+def test_other_owners_writes_are_not_dropped():
+    table = FakeTable({'Ann': 'v1'})
+    queue = make_queue(table, flush_interval=0.2)
+
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+    queue.enqueue('manager-b', 'target', 'Ann', {'GOAL': 9}, 'v1')
+
+    [first] = wait_for(queue, 'manager-a', 1)
+    [second] = wait_for(queue, 'manager-b', 1)
+    # One write per row and batch, in enqueue order; the later one sees the first's version
+    assert table.batches == [['Ann'], ['Ann']]
+    assert first['status'] == SAVED
+    assert second['status'] == CONFLICT
+    assert second['current'] == {'TIMESTAMP': first['version']}
+    assert table.values['Ann'] == {'GOAL': 5}
+
+
+def test_owner_can_save_again_from_the_version_they_replaced():
+    table = FakeTable({'Ann': 'v1'})
+    queue = make_queue(table)
+
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+    wait_for(queue, 'manager-a', 1)
+    # The editor still holds v1 until it reloads
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 6}, 'v1')
+
+    [record] = wait_for(queue, 'manager-a', 1)
+    assert record['status'] == SAVED
+    assert table.values['Ann'] == {'GOAL': 6}
+
+
+def test_identical_submission_is_written_once():
+    table = FakeTable({'Ann': 'v1'})
+    queue = make_queue(table, flush_interval=0.2)
+
+    first = queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+    second = queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+
+    assert first == second
+    assert wait_for(queue, 'manager-a', 1)[0]['status'] == SAVED
+    assert table.batches == [['Ann']]
+
+
+def test_failed_flush_retries_with_backoff_on_a_new_session():
+    table = FakeTable({'Ann': 'v1'}, failures=2)
+    queue = make_queue(table, retry_backoff=0.1)
+
+    started = time.monotonic()
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+
+    assert wait_for(queue, 'manager-a', 1)[0]['status'] == SAVED
+    # Backoff of 0.1 s, then 0.2 s, after the first flush interval
+    assert time.monotonic() - started >= 0.35
+    assert len(table.sessions) == 3
+    assert [session.closed for session in table.sessions] == [True, True, False]
+
+
+def test_write_fails_after_max_attempts():
+    table = FakeTable({'Ann': 'v1'}, failures=10)
+    queue = make_queue(table, retry_backoff=0.01, max_attempts=3)
+
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+
+    [record] = wait_for(queue, 'manager-a', 1)
+    assert record['status'] == FAILED
+    assert record['message'] == "connection dropped"
+    assert table.failures == 7
+
+
+def test_on_saved_runs_before_owner_sees_the_save():
+    table = FakeTable({'Ann': 'v1', 'Bob': 'v1'})
+    seen = []
+
+    def on_saved(kind, entries):
+        seen.append((kind, sorted(entry['key'] for entry in entries), queue.collect('manager-a')))
+
+    queue = make_queue(table, on_saved=on_saved)
+    queue.enqueue('manager-a', 'target', 'Ann', {'GOAL': 5}, 'v1')
+    queue.enqueue('manager-a', 'target', 'Bob', {'GOAL': 5}, 'stale')
+
+    statuses = sorted(record['status'] for record in wait_for(queue, 'manager-a', 2))
+    assert statuses == [CONFLICT, SAVED]
+    # Only the saved entry is passed, and nothing was finished yet when it ran
+    assert seen == [('target', ['Ann'], [])]
+
+
+def test_uncollected_statuses_expire():
+    table = FakeTable({'Ann': 'v1', 'Bob': 'v1'})
+    queue = make_queue(table, status_ttl=0.2)
+
+    queue.enqueue('closed-tab', 'target', 'Ann', {'GOAL': 5}, 'v1')
+    while queue.pending_count('closed-tab'):
+        time.sleep(0.01)
+    time.sleep(0.3)
+    # Expired records are dropped when the next batch finishes
+    queue.enqueue('manager-b', 'target', 'Bob', {'GOAL': 5}, 'v1')
+    wait_for(queue, 'manager-b', 1)
+
+    assert queue.collect('closed-tab') == []
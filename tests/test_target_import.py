@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from target_import import STAGED_COLUMNS, validate_chunk
+
+USERS_BY_NAME = {
+    'ann lee': ('Ann Lee', '005A'),
+    'bob ray': ('Bob Ray', '005B'),
+}
+VALID_MARKETS = ['Phoenix', 'Dallas']
+VALID_TYPES = ['🏠🏃 Hybrid', '🏃 Field Marketing', '🏠 Web To Home']
+
+
+def validate(rows, first_row_number=2):
+    return validate_chunk(pd.DataFrame(rows, dtype=str), first_row_number, USERS_BY_NAME, VALID_MARKETS, VALID_TYPES)
+
+
+def test_valid_rows_are_resolved_and_typed():
+    valid, rejected = validate([
+        {'Full Name': ' ann LEE ', 'Goal': '12', 'Active': 'true', 'Market': 'Dallas'},
+        {'Full Name': 'Bob Ray', 'Goal': '8.0', 'Active': 'No', 'Market': None},
+    ])
+
+    assert rejected.empty
+    assert list(valid.columns) == STAGED_COLUMNS
+    assert list(valid['FILE_ROW']) == [2, 3]
+    assert list(valid['NAME']) == ['Ann Lee', 'Bob Ray']
+    assert list(valid['SALESFORCE_ID']) == ['005A', '005B']
+    assert list(valid['ACTIVE']) == ['Yes', 'No']
+    assert list(valid['GOAL']) == [12, 8]
+    assert valid['MARKET'].tolist() == ['Dallas', None]
+    # Columns missing from the file keep the current value
+    assert valid['RANK'].isna().all()
+    assert valid['TYPE'].isna().all()
+
+
+@pytest.mark.parametrize('row, reason', [
+    ({'NAME': 'Nobody', 'GOAL': '5'}, 'Unknown closer name'),
+    ({'NAME': 'Ann Lee', 'MARKET': 'Atlantis'}, 'Unknown market'),
+    ({'NAME': 'Ann Lee', 'TYPE': 'Door To Door'}, 'Unknown type'),
+    ({'NAME': 'Ann Lee', 'ACTIVE': 'maybe'}, 'ACTIVE must be Yes or No'),
+    ({'NAME': 'Ann Lee', 'GOAL': '2.5'}, 'GOAL must be a whole number'),
+    ({'NAME': 'Ann Lee', 'FM_RANK': 'first'}, 'FM_RANK must be a whole number'),
+])
+def test_invalid_rows_are_rejected_with_a_reason(row, reason):
+    valid, rejected = validate([{'NAME': 'Bob Ray', 'GOAL': '3'}, row], first_row_number=10)
+
+    assert list(valid['NAME']) == ['Bob Ray']
+    assert rejected.to_dict('records') == [{'FILE_ROW': 11, 'NAME': row['NAME'], 'REASON': reason}]
+
+
+def test_first_problem_of_a_row_is_reported():
+    _, rejected = validate([{'NAME': 'Nobody', 'MARKET': 'Atlantis', 'GOAL': 'x'}])
+
+    assert list(rejected['REASON']) == ['Unknown closer name']
+
+
+def test_file_without_name_column_is_refused():
+    with pytest.raises(ValueError, match='NAME'):
+        validate([{'CLOSER': 'Ann Lee', 'GOAL': '5'}])
+
+
+def test_file_without_target_columns_is_refused():
+    with pytest.raises(ValueError, match='at least one'):
+        validate([{'NAME': 'Ann Lee', 'NOTES': 'hi'}])
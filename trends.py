@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Per-closer appointment counts by week and sales channel, maintained incrementally
+# from raw.salesforce.opportunity so trend views never scan the full history
+WEEKLY_TABLE = 'raw.snowflake.lm_weekly_appointments'
+
+CREATE_WEEKLY_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {WEEKLY_TABLE} (
+        CLOSER_ID VARCHAR,
+        SALES_CHANNEL VARCHAR,
+        WEEK_START DATE,
+        APPOINTMENTS INTEGER,
+        UPDATED_AT TIMESTAMP_NTZ
+    )
+"""
+
+# Start of the weeks recomputed on every refresh: two weeks before the current
+# week, through every later week including future ones. Older weeks are settled.
+# An empty table is filled from the whole history once.
+REFRESH_WINDOW_QUERY = f"""
+    SELECT CASE WHEN COUNT(*) = 0 THEN '1900-01-01'::date
+        ELSE DATEADD(week, -2, DATE_TRUNC('week', CURRENT_DATE())) END AS WINDOW_START
+    FROM {WEEKLY_TABLE}
+"""
+
+# Parameter: first week of the refresh window
+DELETE_RECENT_WEEKS = f"""
+    DELETE FROM {WEEKLY_TABLE}
+    WHERE WEEK_START >= ?
+"""
+
+# Parameter: first week of the refresh window
+INSERT_RECENT_WEEKS = f"""
+    INSERT INTO {WEEKLY_TABLE} (CLOSER_ID, SALES_CHANNEL, WEEK_START, APPOINTMENTS, UPDATED_AT)
+    SELECT owner_id, sales_channel_c, DATE_TRUNC('week', first_scheduled_close_start_date_time_c)::date,
+        COUNT(first_scheduled_close_start_date_time_c), CURRENT_TIMESTAMP()
+    FROM raw.salesforce.opportunity
+    WHERE first_scheduled_close_start_date_time_c >= ?
+    GROUP BY 1, 2, 3
+"""
+
+# Parameters: sales channel, number of weeks back from the current week
+WEEKLY_TREND_QUERY = f"""
+    SELECT CLOSER_ID, WEEK_START, APPOINTMENTS
+    FROM {WEEKLY_TABLE}
+    WHERE SALES_CHANNEL = ?
+    AND WEEK_START > DATEADD(week, -?, DATE_TRUNC('week', CURRENT_DATE()))
+    AND WEEK_START <= DATE_TRUNC('week', CURRENT_DATE())
+"""
+
+
+# Recompute the recent weeks of the aggregate in one transaction
+def refresh_weekly_aggregate(session):
+    session.sql(CREATE_WEEKLY_TABLE).collect()
+    window_start = session.sql(REFRESH_WINDOW_QUERY).collect()[0]['WINDOW_START']
+    session.sql("BEGIN").collect()
+    try:
+        session.sql(DELETE_RECENT_WEEKS, params=[window_start]).collect()
+        session.sql(INSERT_RECENT_WEEKS, params=[window_start]).collect()
+        session.sql("COMMIT").collect()
+    except Exception:
+        session.sql("ROLLBACK").collect()
+        raise
+
+
+class AggregateRefresher:
+    # Runs `refresh` (e.g. refresh_weekly_aggregate on a session of its own) in a
+    # background thread at most once per `max_age` seconds. Viewers keep reading
+    # the last aggregate meanwhile instead of waiting for the transaction, or for
+    # the backfill of an empty table.
+
+    def __init__(self, refresh, max_age=900):
+        self._refresh = refresh
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._refreshing = False
+        # Time the last refresh of this process finished, None before the first
+        self.refreshed_at = None
+
+    # Start a refresh if one is due; returns refreshed_at
+    def check(self):
+        with self._lock:
+            due = not self._refreshing and (self._started_at is None or time.time() - self._started_at > self._max_age)
+            if due:
+                self._refreshing = True
+                self._started_at = time.time()
+        if due:
+            threading.Thread(target=self._background_refresh, name='trend-refresh', daemon=True).start()
+        return self.refreshed_at
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+            self.refreshed_at = time.time()
+        except Exception:
+            # Keep serving the last aggregate; the next check after max_age retries
+            logger.exception("Weekly trend aggregate refresh failed")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+# Fetch the last `weeks` weeks for one sales channel from the aggregate
+def load_weekly(session, sales_channel, weeks):
+    return session.sql(WEEKLY_TREND_QUERY, params=[sales_channel, weeks]).to_pandas()
+
+
+# Turn the long (CLOSER_ID, WEEK_START, APPOINTMENTS) rows into compact arrays:
+# the week start dates, a closer id -> row lookup and an int32 counts matrix
+# with one row per closer and one column per week, oldest week first
+def build_trend_arrays(df_weekly, weeks, current_week=None):
+    if current_week is None:
+        today = pd.Timestamp.today().normalize()
+        current_week = today - pd.Timedelta(days=today.weekday())
+    week_starts = pd.date_range(end=pd.Timestamp(current_week), periods=weeks, freq='7D')
+
+    closer_ids = pd.unique(df_weekly['CLOSER_ID'])
+    counts = np.zeros((len(closer_ids), weeks), dtype=np.int32)
+    if len(df_weekly):
+        rows = pd.Index(closer_ids).get_indexer(df_weekly['CLOSER_ID'])
+        columns = ((pd.to_datetime(df_weekly['WEEK_START']) - week_starts[0]).dt.days // 7).to_numpy()
+        in_range = (columns >= 0) & (columns < weeks)
+        np.add.at(counts, (rows[in_range], columns[in_range]), df_weekly['APPOINTMENTS'].to_numpy()[in_range])
+
+    return {
+        'weeks': week_starts.to_numpy(),
+        'closers': {closer_id: row for row, closer_id in enumerate(closer_ids)},
+        'counts': counts,
+    }
+
+
+# Weekly counts of one closer, zeros if they had no appointments in the range
+def closer_series(arrays, closer_id):
+    row = arrays['closers'].get(closer_id)
+    if row is None:
+        return np.zeros(arrays['counts'].shape[1], dtype=np.int32)
+    return arrays['counts'][row]
+
+
+# Summed weekly counts of several closers, e.g. a market
+def total_series(arrays, closer_ids):
+    rows = [arrays['closers'][closer_id] for closer_id in closer_ids if closer_id in arrays['closers']]
+    return arrays['counts'][rows].sum(axis=0)
+
+
+# Average neighbouring weeks so a long series fits in `points` sparkline points
+def downsample(values, points):
+    values = np.asarray(values, dtype=float)
+    if len(values) <= points:
+        return values
+    buckets = np.array_split(values, points)
+    return np.array([bucket.mean() for bucket in buckets])
+
+
+# Inline SVG sparkline of weekly counts with a dashed line at the goal
+def sparkline_svg(values, goal, color, width=120, height=24, points=26):
+    values = downsample(values, points)
+    top = max(values.max() if len(values) else 0, goal, 1)
+    step = width / max(len(values) - 1, 1)
+    coordinates = ' '.join(
+        f"{i * step:.1f},{height - value / top * (height - 2) - 1:.1f}" for i, value in enumerate(values)
+    )
+    goal_y = height - goal / top * (height - 2) - 1
+    return f"""
+        <svg viewBox="0 0 {width} {height}" preserveAspectRatio="none" style="width: 100%; height: {height}px;">
+            <line x1="0" y1="{goal_y:.1f}" x2="{width}" y2="{goal_y:.1f}" stroke="#888" stroke-dasharray="3,3" stroke-width="1"/>
+            <polyline points="{coordinates}" fill="none" stroke="{color}" stroke-width="2"/>
+        </svg>
+    """